@@ -0,0 +1,5 @@
+"""Offline benchmarks for the FMI integration.
+
+The benchmarks only exercise the parts of the integration that do not need Home Assistant (session, parser and
+fetcher), and load them with the exporter's ``load_fmi``.
+"""
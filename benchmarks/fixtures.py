@@ -0,0 +1,271 @@
+"""Fixture documents for the benchmarks.
+
+``python -m benchmarks.fixtures generate`` writes synthetic documents that follow the structure of real FMI responses
+(member order, namespaces, whitespace) at realistic sizes. ``python -m benchmarks.fixtures record`` replaces them with
+live responses from opendata.fmi.fi when network access is available. Both store gzip-compressed files in
+``benchmarks/fixtures``.
+"""
+import asyncio
+from datetime import datetime, timedelta
+import gzip
+import os
+import random
+import sys
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+OBSERVATION_QUERY = "fmi::observations::weather::simple"
+FORECAST_QUERY = "fmi::forecast::harmonie::surface::point::simple"
+COVERAGE_QUERY = "fmi::forecast::harmonie::surface::point::multipointcoverage"
+
+OBSERVATION_PARAMS = ["t2m", "ws_10min", "wg_10min", "wd_10min", "rh", "td", "r_1h", "ri_10min", "snow_aws", "p_sea",
+                      "vis", "n_man", "wawa"]
+FORECAST_PARAMS = ["temperature", "pressure", "humidity", "dewpoint", "windspeedms", "winddirection", "windgust",
+                   "windums", "windvms", "maximumwind", "precipitation1h", "precipitationamount", "totalcloudcover",
+                   "lowcloudcover", "mediumcloudcover", "highcloudcover", "radiationglobal", "radiationlw",
+                   "geopheight", "visibility", "weathersymbol3", "weathernumber", "hourlymaximumgust",
+                   "hourlymaximumwindspeed"]
+
+FIXTURES = {
+    "observation.xml.gz": f"/wfs/eng?request=getFeature&storedquery_id={OBSERVATION_QUERY}&fmisid=100971",
+    "forecast_48h.xml.gz": (f"/wfs/eng?request=getFeature&storedquery_id={FORECAST_QUERY}&place=helsinki"
+                            f"&timestep=30&starttime={{start}}&endtime={{end}}"),
+    "forecast_48h_coverage.xml.gz": (f"/wfs/eng?request=getFeature&storedquery_id={COVERAGE_QUERY}&place=helsinki"
+                                     f"&timestep=30&starttime={{start}}&endtime={{end}}"),
+    "stored_queries.xml.gz": "/wfs/eng?request=describeStoredQueries",
+    "meta_observation.xml.gz": "/meta?observableProperty=observation&language=eng",
+    "meta_forecast.xml.gz": "/meta?observableProperty=forecast&language=eng",
+}
+
+FEATURE_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<wfs:FeatureCollection
+  timeStamp="{timestamp}"
+  numberReturned="{count}"
+  numberMatched="{count}"
+      xmlns:wfs="http://www.opengis.net/wfs/2.0"
+      xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+      xmlns:xlink="http://www.w3.org/1999/xlink"
+      xmlns:om="http://www.opengis.net/om/2.0"
+      xmlns:ompr="http://inspire.ec.europa.eu/schemas/ompr/3.0"
+      xmlns:omso="http://inspire.ec.europa.eu/schemas/omso/3.0"
+      xmlns:gml="http://www.opengis.net/gml/3.2"
+      xmlns:gmd="http://www.isotc211.org/2005/gmd"
+      xmlns:gco="http://www.isotc211.org/2005/gco"
+      xmlns:swe="http://www.opengis.net/swe/2.0"
+      xmlns:gmlcov="http://www.opengis.net/gmlcov/1.0"
+      xmlns:sam="http://www.opengis.net/sampling/2.0"
+      xmlns:sams="http://www.opengis.net/samplingSpatial/2.0"
+      xmlns:wml2="http://www.opengis.net/waterml/2.0"
+      xmlns:target="http://xml.fmi.fi/namespace/om/atmosphericfeatures/1.1"
+      xmlns:BsWfs="http://xml.fmi.fi/schema/wfs/2.0"
+      xsi:schemaLocation="http://www.opengis.net/wfs/2.0 http://schemas.opengis.net/wfs/2.0/wfs.xsd
+      http://xml.fmi.fi/schema/wfs/2.0 http://xml.fmi.fi/schema/wfs/2.0/fmi_wfs_simplefeature.xsd">
+"""
+
+FEATURE_MEMBER = """
+\t<wfs:member>
+            <BsWfs:BsWfsElement gml:id="BsWfsElement.1.{time_index}.{param_index}">
+                <BsWfs:Location>
+                    <gml:Point gml:id="BsWfsElementP.1.{time_index}.{param_index}" srsDimension="2" srsName="http://www.opengis.net/def/crs/EPSG/0/4258">
+                        <gml:pos>{pos} </gml:pos>
+                    </gml:Point>
+                </BsWfs:Location>
+                <BsWfs:Time>{time}</BsWfs:Time>
+                <BsWfs:ParameterName>{name}</BsWfs:ParameterName>
+                <BsWfs:ParameterValue>{value}</BsWfs:ParameterValue>
+            </BsWfs:BsWfsElement>
+\t</wfs:member>
+"""
+
+
+def feature_document(params: list[str], start: datetime, steps: int, step: timedelta, positions: list[str],
+                     nan_ratio: float = 0.05, seed: int = 1) -> bytes:
+    rnd = random.Random(seed)
+    members = []
+
+    for pos in positions:
+        for time_index in range(steps):
+            time = (start + step * time_index).strftime("%Y-%m-%dT%H:%M:%SZ")
+            for param_index, name in enumerate(params):
+                value = "NaN" if rnd.random() < nan_ratio else f"{rnd.uniform(-20, 40):.1f}"
+                members.append(FEATURE_MEMBER.format(time_index=time_index + 1, param_index=param_index + 1,
+                                                     pos=pos, time=time, name=name, value=value))
+
+    header = FEATURE_HEADER.format(timestamp=start.strftime("%Y-%m-%dT%H:%M:%SZ"), count=len(members))
+    return (header + "".join(members) + "</wfs:FeatureCollection>\n").encode()
+
+
+COVERAGE_MEMBER = """
+	<wfs:member>
+		<omso:GridSeriesObservation gml:id="obs-obs-1-1">
+			<om:phenomenonTime>
+				<gml:TimePeriod gml:id="time-interval-1-1">
+					<gml:beginPosition>{begin}</gml:beginPosition>
+					<gml:endPosition>{end}</gml:endPosition>
+				</gml:TimePeriod>
+			</om:phenomenonTime>
+			<om:featureOfInterest>
+				<sams:SF_SpatialSamplingFeature gml:id="sampling-feature-1-1">
+					<sams:shape>
+						<gml:MultiPoint gml:id="mp-1-1">{points}
+						</gml:MultiPoint>
+					</sams:shape>
+				</sams:SF_SpatialSamplingFeature>
+			</om:featureOfInterest>
+			<om:result>
+				<gmlcov:MultiPointCoverage gml:id="mpcv-1-1">
+					<gml:domainSet>
+						<gmlcov:SimpleMultiPoint gml:id="mp-1-1-grid" srsName="http://xml.fmi.fi/gis/epsg4258-time" srsDimension="3">
+							<gmlcov:positions>
+{positions}                </gmlcov:positions>
+						</gmlcov:SimpleMultiPoint>
+					</gml:domainSet>
+					<gml:rangeSet>
+						<gml:DataBlock>
+							<gml:rangeParameters/>
+							<gml:doubleOrNilReasonTupleList>
+{values}                </gml:doubleOrNilReasonTupleList>
+						</gml:DataBlock>
+					</gml:rangeSet>
+					<gml:coverageFunction>
+						<gml:CoverageMappingRule>
+							<gml:ruleDefinition>Linear</gml:ruleDefinition>
+						</gml:CoverageMappingRule>
+					</gml:coverageFunction>
+					<gmlcov:rangeType>
+						<swe:DataRecord>{fields}
+						</swe:DataRecord>
+					</gmlcov:rangeType>
+				</gmlcov:MultiPointCoverage>
+			</om:result>
+		</omso:GridSeriesObservation>
+	</wfs:member>
+"""
+
+
+def coverage_document(params: list[str], start: datetime, steps: int, step: timedelta, positions: list[str],
+                      nan_ratio: float = 0.05, seed: int = 1) -> bytes:
+    """The same samples as feature_document() with the same arguments, as a single MultiPointCoverage member"""
+    rnd = random.Random(seed)
+    epoch = datetime(1970, 1, 1)
+    rows = []
+    values = []
+
+    for pos in positions:
+        for time_index in range(steps):
+            rows.append(f"                {pos}  {int((start + step * time_index - epoch).total_seconds())} \n")
+            values.append("                " + " ".join(
+                "NaN" if rnd.random() < nan_ratio else f"{rnd.uniform(-20, 40):.1f}" for _ in params) + " \n")
+
+    points = "".join(f'\n\t\t\t\t\t\t\t<gml:pointMember><gml:Point gml:id="point-{index + 1}" '
+                     f'srsName="http://www.opengis.net/def/crs/EPSG/0/4258" srsDimension="2">'
+                     f'<gml:name>Point {index + 1}</gml:name><gml:pos>{pos} </gml:pos></gml:Point></gml:pointMember>'
+                     for index, pos in enumerate(positions))
+    fields = "".join(f'\n\t\t\t\t\t\t\t<swe:field name="{name}" '
+                     f'xlink:href="https://opendata.fmi.fi/meta?observableProperty=forecast&amp;param={name}"/>'
+                     for name in params)
+    member = COVERAGE_MEMBER.format(begin=start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                                    end=(start + step * (steps - 1)).strftime("%Y-%m-%dT%H:%M:%SZ"), points=points,
+                                    positions="".join(rows), values="".join(values), fields=fields)
+
+    header = FEATURE_HEADER.format(timestamp=start.strftime("%Y-%m-%dT%H:%M:%SZ"), count=1)
+    return (header + member + "</wfs:FeatureCollection>\n").encode()
+
+
+def stored_queries_document(count: int = 180, seed: int = 2) -> bytes:
+    rnd = random.Random(seed)
+    families = ["observations::weather", "observations::mareograph", "observations::wave", "observations::radiation",
+                "observations::airquality", "observations::soil", "forecast::harmonie::surface::point",
+                "forecast::ecmwf::surface::point", "forecast::hirlam::surface::point", "forecast::wam::point"]
+    suffixes = ["::simple", "::multipointcoverage", "::timevaluepair", "::hourly::simple", "::daily::simple"]
+    params = [("starttime", "dateTime"), ("endtime", "dateTime"), ("timestep", "int"), ("parameters", "NameList"),
+              ("crs", "xsd:string"), ("bbox", "xsd:string"), ("place", "xsd:string"), ("fmisid", "xsd:int"),
+              ("maxlocations", "xsd:int"), ("geoid", "xsd:int"), ("wmo", "xsd:int"), ("latlon", "xsd:string"),
+              ("timezone", "xsd:string")]
+    descriptions = []
+
+    for index in range(count):
+        query_id = f"fmi::{families[index % len(families)]}{'' if index < len(families) * len(suffixes) else index}" \
+                   f"{suffixes[index // len(families) % len(suffixes)]}"
+        parameters = "".join(
+            f'<Parameter name="{name}" type="{kind}"><Title>{name} parameter</Title>'
+            f'<Abstract>{"Lorem ipsum dolor sit amet " * rnd.randint(2, 8)}</Abstract></Parameter>\n'
+            for name, kind in params if name != "fmisid" or index % 7 != 0)
+        descriptions.append(
+            f'<StoredQueryDescription id="{query_id}">\n<Title>Stored query {index}</Title>\n'
+            f'<Abstract>{"Consectetur adipiscing elit. " * rnd.randint(4, 20)}</Abstract>\n{parameters}'
+            f'<QueryExpressionText returnFeatureTypes="BsWfs:BsWfsElement" '
+            f'language="urn:ogc:def:queryLanguage:OGC-WFS::WFS_QueryExpression" isPrivate="false"/>\n'
+            f'</StoredQueryDescription>\n')
+
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<DescribeStoredQueriesResponse xmlns="http://www.opengis.net/wfs/2.0" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+            + "".join(descriptions) + '</DescribeStoredQueriesResponse>\n').encode()
+
+
+def meta_document(params: list[str], extra: int = 250, seed: int = 3) -> bytes:
+    rnd = random.Random(seed)
+    units = ["degC", "m/s", "deg", "%", "mm", "hPa", "m", "1", "cm", "W/m2"]
+    names = params + [f"param{index}" for index in range(extra)]
+    components = "".join(
+        f'<component><ObservableProperty gml:id="{name}"><label>{name} label</label>'
+        f'<basePhenomenon>{name} phenomenon</basePhenomenon><uom uom="{rnd.choice(units)}"/>'
+        f'<StatisticalMeasure gml:id="stat-{name}"><statisticalFunction>avg</statisticalFunction>'
+        f'<aggregationTimePeriod>PT10M</aggregationTimePeriod></StatisticalMeasure></ObservableProperty></component>\n'
+        for name in names)
+
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<CompositeObservableProperty xmlns="http://inspire.ec.europa.eu/schemas/omop/2.9" '
+            'xmlns:gml="http://www.opengis.net/gml/3.2" gml:id="observation">\n'
+            + components + '</CompositeObservableProperty>\n').encode()
+
+
+def generate() -> None:
+    start = datetime(2024, 5, 13)
+    documents = {
+        "observation.xml.gz": feature_document(OBSERVATION_PARAMS, start, 72, timedelta(minutes=10),
+                                               ["60.17523 24.94459"]),
+        "forecast_48h.xml.gz": feature_document(FORECAST_PARAMS, start, 97, timedelta(minutes=30),
+                                                ["60.16952 24.93545"], nan_ratio=0),
+        "forecast_48h_coverage.xml.gz": coverage_document(FORECAST_PARAMS, start, 97, timedelta(minutes=30),
+                                                          ["60.16952 24.93545"], nan_ratio=0),
+        "stored_queries.xml.gz": stored_queries_document(),
+        "meta_observation.xml.gz": meta_document(OBSERVATION_PARAMS),
+        "meta_forecast.xml.gz": meta_document(FORECAST_PARAMS),
+    }
+
+    for name, content in documents.items():
+        write_fixture(name, content)
+
+
+async def async_record() -> None:
+    import aiohttp
+
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    async with aiohttp.ClientSession() as session:
+        for name, path in FIXTURES.items():
+            url = "https://opendata.fmi.fi" + path.format(start=now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                                                          end=(now + timedelta(hours=48)).strftime("%Y-%m-%dT%H:%M:%SZ"))
+            async with session.get(url) as response:
+                response.raise_for_status()
+                write_fixture(name, await response.read())
+
+
+def write_fixture(name: str, content: bytes) -> None:
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    with gzip.GzipFile(os.path.join(FIXTURE_DIR, name), "wb", mtime=0) as file:
+        file.write(content)
+    print(f"{name}: {len(content)} bytes")
+
+
+def read_fixture(name: str) -> bytes:
+    with gzip.open(os.path.join(FIXTURE_DIR, name), "rb") as file:
+        return file.read()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "record":
+        asyncio.run(async_record())
+    else:
+        generate()
@@ -0,0 +1,182 @@
+"""Runs the offline benchmarks and prints a report.
+
+    python -m benchmarks.run [--entries 30] [--stations 6] [--rounds 3] [--repeat 5] [--delay 0.02] [--time-scale 0.02]
+
+The parse section times every parser against the fixtures. It reports the median wall time, the tracemalloc peak,
+and the number of generation 0 garbage collections as a proxy for allocation churn. The refresh section starts the
+local stand-in server and simulates coordinator refreshes for N entries spread over a number of stations. It reports
+per-refresh latency, the requests and bytes the server handled, and the session's own traffic statistics. The
+scheduled section then lets every entry plan its next poll with the poll scheduler, as if the refreshes had finished a
+few seconds apart, and replays those polls with time sped up by --time-scale. It counts the getFeature requests with the
+jitter shared by each batch group and with a jitter of its own for every entry.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from fmi_export import load_fmi
+from .fixtures import read_fixture, OBSERVATION_QUERY, OBSERVATION_PARAMS, FORECAST_QUERY, FORECAST_PARAMS, \
+    COVERAGE_QUERY
+from .server import FMIStandInServer
+
+fmi = load_fmi()
+
+import fmi.fetcher  # noqa: E402
+from fmi.fetcher import FMIFetcher, FMIQueryKey, batch_group  # noqa: E402
+from fmi.parser import parse_features  # noqa: E402
+from fmi.scheduler import FMIPollScheduler  # noqa: E402
+from fmi.session import FMISession, parse_stored_queries, parse_units, get_property_type  # noqa: E402
+
+
+def measure(function: Callable[[], Any], repeat: int) -> dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    collections = gc.get_stats()[0]["collections"]
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"ms": statistics.median(timings) * 1000, "peak_kib": peak / 1024,
+            "gc0": gc.get_stats()[0]["collections"] - collections}
+
+
+def parse_benchmarks(repeat: int) -> list[tuple[str, int, dict[str, float]]]:
+    observation = read_fixture("observation.xml.gz")
+    forecast = read_fixture("forecast_48h.xml.gz")
+    coverage = read_fixture("forecast_48h_coverage.xml.gz")
+    stored_queries = read_fixture("stored_queries.xml.gz")
+    meta = read_fixture("meta_observation.xml.gz")
+
+    cases = [
+        ("observation latest", observation, lambda: parse_features(observation, OBSERVATION_QUERY, True)),
+        ("observation full", observation, lambda: parse_features(observation, OBSERVATION_QUERY, False)),
+        ("forecast 48h", forecast, lambda: parse_features(forecast, FORECAST_QUERY, False)),
+        ("forecast 48h coverage", coverage, lambda: parse_features(coverage, COVERAGE_QUERY, False)),
+        ("describeStoredQueries", stored_queries, lambda: parse_stored_queries(stored_queries, "::simple")),
+        ("meta units", meta, lambda: parse_units(meta)),
+    ]
+
+    return [(name, len(content), measure(function, repeat)) for name, content, function in cases]
+
+
+async def async_refresh_benchmark(base_url: str, entries: int, stations: int, rounds: int,
+                                  time_scale: float) -> tuple[list[list[float]], dict[str, int], dict[str, Any]]:
+    session = FMISession(base_url=base_url)
+    fetcher = FMIFetcher(session)
+    units: dict[str, asyncio.Task] = {}
+
+    keys = []
+    for index in range(entries):
+        station = str(100000 + index % stations)
+        if index % 3 == 2:
+            keys.append((FMIQueryKey("eng", FORECAST_QUERY, "fmisid", station, 48, 0, 30),
+                         FORECAST_PARAMS[index % len(FORECAST_PARAMS)]))
+        else:
+            keys.append((FMIQueryKey("eng", OBSERVATION_QUERY, "fmisid", station, None, None, None),
+                         OBSERVATION_PARAMS[index % len(OBSERVATION_PARAMS)]))
+
+    async def async_get_unit(query_id: str, parameter: str) -> str | None:
+        property_type = get_property_type(query_id)
+        if property_type not in units:
+            units[property_type] = asyncio.ensure_future(session.async_get_units("eng", property_type))
+        return (await units[property_type]).get(parameter)
+
+    async def async_refresh(key: FMIQueryKey, parameter: str) -> float:
+        start = time.perf_counter()
+        await asyncio.gather(fetcher.async_get_features(key), async_get_unit(key.query_id, parameter))
+        return time.perf_counter() - start
+
+    async def async_scheduled_refresh(key: FMIQueryKey, parameter: str, delay: float) -> None:
+        await asyncio.sleep(delay * time_scale)
+        await async_refresh(key, parameter)
+
+    async def async_scheduled_round(groups: list[str]) -> int:
+        now = datetime.utcnow().replace(second=0, microsecond=0)
+        newest = now - timedelta(minutes=now.minute % 10)
+        polls = []
+        for (key, _), group in zip(keys, groups):
+            finished = now + timedelta(seconds=random.uniform(0, 5))
+            polls.append(finished + FMIPollScheduler(key.query_id, group).next_interval(finished, newest))
+
+        # only the spread within a query matters for batching, so each query starts with its own first poll
+        first = {}
+        for (key, _), poll in zip(keys, polls):
+            first[key.query_id] = min(poll, first.get(key.query_id, poll))
+
+        requests = session.stats.as_dict()["requests"]
+        fetcher.invalidate()
+        await asyncio.gather(*[async_scheduled_refresh(key, parameter, (poll - first[key.query_id]).total_seconds())
+                               for (key, parameter), poll in zip(keys, polls)])
+        return session.stats.as_dict()["requests"] - requests
+
+    results = []
+    scheduled = {}
+    batch_delay = fmi.fetcher.BATCH_DELAY
+    try:
+        for _ in range(rounds):
+            fetcher.invalidate()
+            results.append(await asyncio.gather(*[async_refresh(key, parameter) for key, parameter in keys]))
+
+        fmi.fetcher.BATCH_DELAY = batch_delay * time_scale
+        scheduled["group jitter"] = await async_scheduled_round([str(batch_group(key)) for key, _ in keys])
+        scheduled["per-entry jitter"] = await async_scheduled_round([f"entry {index}" for index in range(entries)])
+    finally:
+        fmi.fetcher.BATCH_DELAY = batch_delay
+        await session.async_close()
+
+    return results, scheduled, session.stats.as_dict()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline FMI benchmarks")
+    parser.add_argument("--entries", type=int, default=30)
+    parser.add_argument("--stations", type=int, default=6)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=0.02, help="simulated server latency in seconds")
+    parser.add_argument("--time-scale", type=float, default=0.02, help="speed-up of the scheduled polls")
+    args = parser.parse_args()
+
+    print(f"{'parse':<24}{'bytes':>10}{'median ms':>12}{'peak KiB':>12}{'gc0':>6}")
+    for name, size, result in parse_benchmarks(args.repeat):
+        print(f"{name:<24}{size:>10}{result['ms']:>12.2f}{result['peak_kib']:>12.0f}{result['gc0']:>6}")
+
+    server = FMIStandInServer(args.delay)
+    base_url = server.start()
+    try:
+        rounds, scheduled, stats = asyncio.run(async_refresh_benchmark(base_url, args.entries, args.stations,
+                                                                       args.rounds, args.time_scale))
+    finally:
+        server.stop()
+
+    print()
+    print(f"refresh of {args.entries} entries on {args.stations} stations")
+    print(f"{'round':<8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for index, latencies in enumerate(rounds):
+        latencies = sorted(latency * 1000 for latency in latencies)
+        print(f"{index + 1:<8}{statistics.median(latencies):>10.1f}"
+              f"{latencies[int(len(latencies) * 0.95) - 1]:>10.1f}{latencies[-1]:>10.1f}")
+    for name, requests in scheduled.items():
+        print(f"scheduled with {name:<17}{requests:>4} getFeature requests")
+    print(f"server handled {server.requests} requests, {server.bytes_sent} bytes")
+    print(f"client cache hits {stats['cache_hits']}, misses {stats['cache_misses']}")
+    for name, query in stats["queries"].items():
+        print(f"  {name}: {query['requests']} requests, {query['bytes']} bytes, {query['members']} members, "
+              f"connect {query['connect_time']:.3f}s, download {query['download_time']:.3f}s, "
+              f"parse {query['parse_time']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
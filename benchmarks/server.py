@@ -0,0 +1,110 @@
+"""Local stand-in for opendata.fmi.fi serving the benchmark fixtures.
+
+getFeature requests are answered with the observation or forecast fixture. The fixture is repeated once per requested
+target, and each copy gets a position derived from the target, so batched multi-target requests can be split back to
+their entries. Responses are sent gzip-compressed when the client asks for it.
+"""
+import asyncio
+import gzip
+import re
+import threading
+
+from aiohttp import web
+
+from .fixtures import read_fixture
+
+POS_PATTERN = re.compile(rb"<gml:pos>([^<]*)</gml:pos>")
+TARGET_TYPES = ["fmisid", "place", "geoid", "latlon"]
+
+
+def target_position(target: str) -> bytes:
+    number = sum(ord(char) * (index + 1) for index, char in enumerate(target))
+    return f"{59.5 + number % 1000 / 1000:.5f} {21.0 + number % 7919 / 1000:.5f} ".encode()
+
+
+class FMIStandInServer:
+
+    def __init__(self, delay: float = 0.0):
+        self._delay = delay
+        self._documents = {name: read_fixture(name) for name in
+                           ["observation.xml.gz", "forecast_48h.xml.gz", "stored_queries.xml.gz",
+                            "meta_observation.xml.gz", "meta_forecast.xml.gz"]}
+        self._cache: dict[tuple, tuple[bytes, bytes]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._runner: web.AppRunner | None = None
+        self._thread: threading.Thread | None = None
+        self.base_url = None
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def start(self) -> str:
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(started,), daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.base_url
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _run(self, started: threading.Event) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+
+        app = web.Application()
+        app.router.add_get("/wfs/{lang}", self._handle_wfs)
+        app.router.add_get("/meta", self._handle_meta)
+
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+        started.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _handle_wfs(self, request: web.Request) -> web.Response:
+        if request.query.get("request") == "describeStoredQueries":
+            return await self._respond(request, ("stored_queries.xml.gz",), self._documents["stored_queries.xml.gz"])
+
+        name = "forecast_48h.xml.gz" if "::forecast" in request.query.get("storedquery_id", "") \
+            else "observation.xml.gz"
+        targets = tuple(value for key in TARGET_TYPES for value in request.query.getall(key, []))
+        return await self._respond(request, (name,) + targets, self._documents[name], targets)
+
+    async def _handle_meta(self, request: web.Request) -> web.Response:
+        name = f"meta_{request.query.get('observableProperty', 'observation')}.xml.gz"
+        return await self._respond(request, (name,), self._documents[name])
+
+    async def _respond(self, request: web.Request, key: tuple, document: bytes,
+                       targets: tuple[str, ...] = ()) -> web.Response:
+        if self._delay > 0:
+            await asyncio.sleep(self._delay)
+
+        if key not in self._cache:
+            content = document if len(targets) == 0 else self._for_targets(document, targets)
+            self._cache[key] = (content, gzip.compress(content, compresslevel=6))
+
+        content, compressed = self._cache[key]
+        self.requests += 1
+
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            self.bytes_sent += len(compressed)
+            return web.Response(body=compressed, content_type="text/xml", headers={"Content-Encoding": "gzip"})
+
+        self.bytes_sent += len(content)
+        return web.Response(body=content, content_type="text/xml")
+
+    @staticmethod
+    def _for_targets(document: bytes, targets: tuple[str, ...]) -> bytes:
+        start = document.index(b"<wfs:member>")
+        end = document.rindex(b"</wfs:member>") + len(b"</wfs:member>")
+        body = document[start:end]
+        members = b"".join(POS_PATTERN.sub(b"<gml:pos>" + target_position(target) + b"</gml:pos>", body)
+                           for target in targets)
+        return document[:start] + members + document[end:]
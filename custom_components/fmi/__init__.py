@@ -1,60 +1,118 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 import logging
-from typing import Any
 
-from dateutil.relativedelta import relativedelta
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
-
-from .const import DOMAIN, DEFAULT_SCAN_INTERVAL, CONF_FORECAST_HOURS, CONF_FORECAST_PAST_HOURS, CONF_QUERY_ID, \
-    CONF_LANG, CONF_FORECAST_STEP, CONF_TARGET, CONF_TARGET_TYPE, CONF_PARAMETER
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.typing import ConfigType
+import voluptuous as vol
+
+from .catalogue import FMIStationCatalogue
+from .const import DOMAIN, DATA_FETCHER, DATA_UNITS, DATA_SNAPSHOTS, DATA_LIMITER, DATA_STATIONS, DATA_CONFIG, \
+    CONF_PARAMETER, CONF_REQUESTS_PER_MINUTE, CONF_REQUEST_BURST, CONF_MAX_STALE, DEFAULT_REQUESTS_PER_MINUTE, \
+    DEFAULT_REQUEST_BURST, DEFAULT_MAX_STALE
+from .coordinator import FMIDataUpdateCoordinator
+from .fetcher import FMIFetcher
+from .limiter import FMIRequestLimiter
+from .services import async_register_services
 from .session import FMISession
+from .snapshot import FMISnapshotStore
+from .units import FMIUnitCache
 
 _LOGGER = logging.getLogger(__name__)
 
+CONFIG_SCHEMA = vol.Schema({
+    vol.Optional(DOMAIN): vol.Schema({
+        vol.Optional(CONF_REQUESTS_PER_MINUTE, default=DEFAULT_REQUESTS_PER_MINUTE): vol.All(
+            vol.Coerce(float), vol.Range(min=1)),
+        vol.Optional(CONF_REQUEST_BURST, default=DEFAULT_REQUEST_BURST): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(CONF_MAX_STALE, default=DEFAULT_MAX_STALE): vol.All(vol.Coerce(int), vol.Range(min=0)),
+    })
+}, extra=vol.ALLOW_EXTRA)
 
-async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    conf = config.get(DOMAIN, {})
     hass.data.setdefault(DOMAIN, {})
+    hass.data[DOMAIN][DATA_CONFIG] = conf
+    hass.data[DOMAIN][DATA_LIMITER] = FMIRequestLimiter(
+        conf.get(CONF_REQUESTS_PER_MINUTE, DEFAULT_REQUESTS_PER_MINUTE),
+        conf.get(CONF_REQUEST_BURST, DEFAULT_REQUEST_BURST))
+
+    async_register_services(hass)
+    return True
+
+
+def get_fetcher(hass: HomeAssistant) -> FMIFetcher:
+    data = hass.data.setdefault(DOMAIN, {})
+
+    if DATA_FETCHER not in data:
+        if DATA_LIMITER not in data:
+            data[DATA_LIMITER] = FMIRequestLimiter(DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_REQUEST_BURST)
 
-    async def async_update_data():
-        now = datetime.utcnow()
-        query_id = str(entry.data[CONF_QUERY_ID])
-        is_forecast = "::forecast" in query_id
-        start_time = get_start_time(query_id, now, entry.data)
-        end_time = now + timedelta(hours=entry.data[CONF_FORECAST_HOURS]) if is_forecast else None
-        api = FMISession()
-        params = {"starttime": start_time.strftime('%Y-%m-%d%%20%H:%M:%S') if start_time is not None else None,
-                  "endtime": end_time.strftime('%Y-%m-%d%%20%H:%M:%S') if end_time is not None else None,
-                  "timestep": entry.data.get(CONF_FORECAST_STEP), "storedquery_id": query_id,
-                  entry.data[CONF_TARGET_TYPE]: entry.data[CONF_TARGET]}
-        return await hass.async_add_executor_job(api.get_feature, entry.data[CONF_LANG], params,
-                                                 entry.data[CONF_PARAMETER], is_forecast is False)
-
-    coord = DataUpdateCoordinator(
-        hass,
-        _LOGGER,
-        name=entry.unique_id or DOMAIN,
-        update_method=async_update_data,
-        update_interval=timedelta(minutes=DEFAULT_SCAN_INTERVAL),
-    )
-
-    await coord.async_config_entry_first_refresh()
+        data[DATA_FETCHER] = FMIFetcher(FMISession(session=async_get_clientsession(hass), limiter=data[DATA_LIMITER]))
+
+    return data[DATA_FETCHER]
+
+
+def get_stations(hass: HomeAssistant) -> FMIStationCatalogue:
+    data = hass.data.setdefault(DOMAIN, {})
+
+    if DATA_STATIONS not in data:
+        data[DATA_STATIONS] = FMIStationCatalogue(hass, get_fetcher(hass).session)
+
+    return data[DATA_STATIONS]
+
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    get_fetcher(hass)
+    get_stations(hass)
+
+    if DATA_UNITS not in hass.data[DOMAIN]:
+        hass.data[DOMAIN][DATA_UNITS] = FMIUnitCache(hass, hass.data[DOMAIN][DATA_FETCHER].session)
+
+    if DATA_SNAPSHOTS not in hass.data[DOMAIN]:
+        hass.data[DOMAIN][DATA_SNAPSHOTS] = FMISnapshotStore(hass)
+
+    coord = FMIDataUpdateCoordinator(hass, entry, hass.data[DOMAIN][DATA_FETCHER], hass.data[DOMAIN][DATA_UNITS],
+                                     hass.data[DOMAIN][DATA_SNAPSHOTS], hass.data[DOMAIN][DATA_STATIONS],
+                                     timedelta(minutes=hass.data[DOMAIN].get(DATA_CONFIG, {}).get(
+                                         CONF_MAX_STALE, DEFAULT_MAX_STALE)))
+
+    restored = await coord.async_restore_snapshot()
+
+    if not restored:
+        await coord.async_config_entry_first_refresh()
 
     hass.data[DOMAIN][entry.entry_id] = coord
 
     await hass.config_entries.async_forward_entry_setups(entry, ["sensor"])
 
+    if restored:
+        entry.async_create_background_task(hass, coord.async_refresh(), f"{DOMAIN} refresh {entry.title}")
+
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
+
+    return True
+
+
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
+async def async_migrate_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    if entry.version == 1:
+        data = dict(entry.data)
+        data[CONF_PARAMETER] = [data[CONF_PARAMETER]]
+        hass.config_entries.async_update_entry(entry, data=data, version=2)
+        _LOGGER.debug(f"Migrated FMI entry {entry.entry_id} to version 2")
+
     return True
 
 
-def get_start_time(query_id: str, now: datetime, data: dict[str, Any]):
-    return now - timedelta(hours=data[CONF_FORECAST_PAST_HOURS]) if "::forecast" in query_id else \
-        now.replace(minute=0, second=0) - relativedelta(hours=1) if "::hourly" in query_id else \
-            now.replace(hour=0, minute=0, second=0) if "::daily" in query_id else \
-                now.replace(day=1, hour=0, minute=0, second=0) if "::monthly" in query_id else \
-                    now.replace(month=1, day=1, hour=0, minute=0, second=0) if "::yearly" in query_id else \
-                        now - timedelta(hours=12) if not query_id.startswith("stuk::") else None
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    snapshots = hass.data.get(DOMAIN, {}).get(DATA_SNAPSHOTS) or FMISnapshotStore(hass)
+    await snapshots.async_remove(entry.entry_id)
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
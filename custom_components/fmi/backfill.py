@@ -0,0 +1,87 @@
+from array import array
+import asyncio
+from datetime import datetime, timezone
+import logging
+from typing import Any
+
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import async_import_statistics
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import CONF_LANG, BACKFILL_CHUNK_HOURS, BACKFILL_CONCURRENCY
+from .fetcher import FMIFetcher, query_key, get_request_params, get_chunks
+from .session import FMIException, select_parameter
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def get_hourly_statistics(times: list[datetime], values: array, after: datetime,
+                          before: datetime) -> list[StatisticData]:
+    buckets: dict[datetime, list[float]] = {}
+
+    for time, value in zip(times, values):
+        if time >= before:
+            continue
+
+        hour = time.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        # an hour that began before the requested start would only get part of its samples
+        if hour < after:
+            continue
+
+        if value != value:
+            continue
+
+        buckets.setdefault(hour, []).append(value)
+
+    return [StatisticData(start=hour, mean=sum(numbers) / len(numbers), min=min(numbers), max=max(numbers))
+            for hour, numbers in sorted(buckets.items())]
+
+
+async def async_backfill(hass: HomeAssistant, entry: ConfigEntry, fetcher: FMIFetcher, parameter: str,
+                         entity_id: str, unit: str | None, start: datetime, end: datetime) -> dict[str, Any]:
+    key = query_key(entry.data)
+    semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+    metadata = StatisticMetaData(has_mean=True, has_sum=False, name=None, source="recorder", statistic_id=entity_id,
+                                 unit_of_measurement=unit)
+    imported = {"chunks": 0, "hours": 0, "failed": []}
+
+    async def async_import_chunk(chunk_start: datetime, chunk_end: datetime) -> None:
+        params = get_request_params(key, chunk_end, chunk_start, chunk_end)
+
+        async with semaphore:
+            features = await fetcher.session.async_get_features(entry.data[CONF_LANG], params, False)
+
+        series = select_parameter(features, parameter)
+        statistics = get_hourly_statistics(series["times"], series["values"], start,
+                                           chunk_end.replace(tzinfo=timezone.utc))
+
+        if len(statistics) > 0:
+            async_import_statistics(hass, metadata, statistics)
+
+        imported["chunks"] += 1
+        imported["hours"] += len(statistics)
+
+    # the current hour is still incomplete, so its statistics would be imported from a partial set of samples
+    start = start.astimezone(timezone.utc)
+    end = min(end.astimezone(timezone.utc), datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0))
+    chunks = get_chunks(start.replace(tzinfo=None), end.replace(tzinfo=None), BACKFILL_CHUNK_HOURS)
+
+    _LOGGER.debug(f"Backfilling {entity_id} from FMI in {len(chunks)} chunks")
+
+    # a failed chunk is reported rather than abandoning the others, whose statistics are imported already
+    results = await asyncio.gather(*[async_import_chunk(chunk_start, chunk_end) for chunk_start, chunk_end in chunks],
+                                   return_exceptions=True)
+
+    for (chunk_start, chunk_end), result in zip(chunks, results):
+        if isinstance(result, BaseException) and not isinstance(result, FMIException):
+            raise result
+        if result is not None:
+            _LOGGER.warning(f"Could not backfill {entity_id} from {chunk_start} to {chunk_end} ({result})")
+            imported["failed"].append({"start": chunk_start.isoformat(), "end": chunk_end.isoformat(),
+                                       "error": str(result)})
+
+    if len(chunks) > 0 and len(imported["failed"]) == len(chunks):
+        raise next(result for result in results if result is not None)
+
+    return imported
@@ -0,0 +1,79 @@
+import time
+from typing import Any
+
+from .const import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, BREAKER_MAX_RESET_TIMEOUT
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+PERMIT_REQUEST = "request"
+PERMIT_PROBE = "probe"
+
+
+class FMICircuitBreaker:
+    """Stops sending requests to a host after repeated failures, and lets a single probe through whenever the reset
+    timeout has passed; the timeout doubles every time a probe fails"""
+
+    def __init__(self, threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT,
+                 max_reset_timeout: float = BREAKER_MAX_RESET_TIMEOUT):
+        self._threshold = threshold
+        self._reset_timeout = reset_timeout
+        self._max_reset_timeout = max_reset_timeout
+        self._timeout = reset_timeout
+        self._opened = 0.0
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.rejected = 0
+
+    def allow(self) -> str | None:
+        if self.state == STATE_CLOSED:
+            return PERMIT_REQUEST
+
+        # only the caller that moves the breaker to half open gets to probe, everyone else is turned away meanwhile
+        if self.state == STATE_OPEN and time.monotonic() - self._opened >= self._timeout:
+            self.state = STATE_HALF_OPEN
+            return PERMIT_PROBE
+
+        self.rejected += 1
+        return None
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the next probe may be sent, 0 while closed or while a probe is running"""
+        if self.state != STATE_OPEN:
+            return 0.0
+        return max(0.0, self._opened + self._timeout - time.monotonic())
+
+    def record_success(self) -> None:
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self._timeout = self._reset_timeout
+
+    def record_failure(self, probe: bool = False) -> None:
+        self.failures += 1
+
+        if self.state == STATE_HALF_OPEN:
+            # a request sent before the breaker opened must not decide the outcome of the probe
+            if not probe:
+                return
+            self._timeout = min(self._timeout * 2, self._max_reset_timeout)
+        elif self.failures < self._threshold:
+            return
+
+        self.state = STATE_OPEN
+        self._opened = time.monotonic()
+
+    def release_probe(self) -> None:
+        # the probe was abandoned without an answer, so the next caller may probe right away
+        if self.state == STATE_HALF_OPEN:
+            self.state = STATE_OPEN
+            self._opened = time.monotonic() - self._timeout
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "reset_timeout": self._timeout,
+        }
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta
+import logging
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .const import STORAGE_VERSION, STORAGE_KEY_STATIONS, STATION_CACHE_MAX_AGE
+from .session import FMISession, FMIException
+from .stations import FMIStation, FMIStationIndex
+
+_LOGGER = logging.getLogger(__name__)
+
+SAVE_DELAY = 10
+
+
+class FMIStationCatalogue:
+    """Station catalogue from fmi::ef::stations with a spatial index, shared by all entries and kept on disk"""
+
+    def __init__(self, hass: HomeAssistant, session: FMISession):
+        self._session = session
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY_STATIONS)
+        self._catalogues: dict[str, dict[str, Any]] | None = None
+        self._indexes: dict[str, tuple[str, FMIStationIndex]] = {}
+        self._lock = asyncio.Lock()
+
+    async def async_get_index(self, lang: str) -> FMIStationIndex:
+        async with self._lock:
+            if self._catalogues is None:
+                self._catalogues = await self._store.async_load() or {}
+
+            catalogue = self._catalogues.get(lang)
+
+            if catalogue is not None and datetime.utcnow() - datetime.fromisoformat(catalogue["updated"]) < timedelta(
+                    days=STATION_CACHE_MAX_AGE):
+                self._session.stats.record_cache("stations", True)
+                return self._get_index(lang, catalogue)
+
+            self._session.stats.record_cache("stations", False)
+
+            try:
+                stations = await self._session.async_get_stations(lang)
+            except FMIException as exception:
+                if catalogue is None:
+                    raise
+                _LOGGER.warning(f"Could not refresh FMI station catalogue, using cached stations ({exception})")
+                return self._get_index(lang, catalogue)
+
+            catalogue = self._catalogues[lang] = {"updated": datetime.utcnow().isoformat(),
+                                                  "stations": [station.as_list() for station in stations]}
+            self._store.async_delay_save(lambda: self._catalogues, SAVE_DELAY)
+
+            return self._get_index(lang, catalogue)
+
+    async def async_find_station(self, lang: str, lat: float, lon: float, max_distance: float) -> FMIStation | None:
+        try:
+            index = await self.async_get_index(lang)
+        except FMIException as exception:
+            _LOGGER.debug(f"FMI station catalogue is not available ({exception})")
+            return None
+
+        found = index.nearest(lat, lon, max_distance=max_distance)
+        return found[0][1] if len(found) > 0 else None
+
+    def _get_index(self, lang: str, catalogue: dict[str, Any]) -> FMIStationIndex:
+        cached = self._indexes.get(lang)
+        if cached is None or cached[0] != catalogue["updated"]:
+            cached = self._indexes[lang] = (catalogue["updated"], FMIStationIndex(
+                [FMIStation.from_list(item) for item in catalogue["stations"]]))
+        return cached[1]
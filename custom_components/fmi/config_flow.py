@@ -12,8 +12,16 @@ from homeassistant.exceptions import HomeAssistantError
 
 from .const import (DOMAIN, CONF_LABEL, CONF_LANG, CONF_QUERY_ID, CONF_QUERY_LABEL, CONF_FORECAST_HOURS, CONF_TARGET,
                     CONF_FORECAST_PAST_HOURS, CONF_FORECAST_STEP, LANGUAGES, CONF_PARAMETER, CONF_TARGET_TYPE,
-                    TARGET_TYPES)
-from .session import FMISession, FMIException
+                    TARGET_TYPES, CONF_FORECAST_ATTRIBUTE, CONF_RECORD_FORECAST, FORECAST_ATTRIBUTE_MODES,
+                    FORECAST_ATTRIBUTE_FULL, ALL_PARAMETERS, CONF_STATION, STATION_SEARCH_RADIUS,
+                    STATION_SUGGESTIONS, STORED_QUERY_SUFFIXES, CONF_FORECAST_POINTS, CONF_FORECAST_AGGREGATE,
+                    DEFAULT_FORECAST_POINTS, FORECAST_AGGREGATE_MODES, FORECAST_AGGREGATE_MEAN)
+from . import get_fetcher, get_stations
+from .limiter import interactive_requests
+from .session import FMIException, parse_parameters
+from .stations import get_query_networks, parse_latlon
+
+KEEP_TARGET = "keep"
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -25,17 +33,20 @@ CONFIGURE_SCHEMA = vol.Schema(
 
 
 async def validate_input(hass: HomeAssistant, data: dict[str, any]) -> str:
+    if len(data[CONF_PARAMETER]) == 0:
+        raise NoParameters
+
     try:
         now = datetime.utcnow()
         is_forecast = "::forecast" in str(data[CONF_QUERY_ID])
         start_time = now - timedelta(
             hours=data[CONF_FORECAST_PAST_HOURS]) if is_forecast is True else now - timedelta(hours=1)
         end_time = now + timedelta(hours=data[CONF_FORECAST_HOURS]) if is_forecast is True else now
-        api = FMISession()
         params = {"starttime": start_time, "endtime": end_time, "timestep": data.get(CONF_FORECAST_STEP),
                   "storedquery_id": data[CONF_QUERY_ID], data[CONF_TARGET_TYPE]: data[CONF_TARGET],
-                  "parameters": data[CONF_PARAMETER]}
-        await hass.async_add_executor_job(api.get_feature, data[CONF_LANG], params, data[CONF_PARAMETER], is_forecast is False)
+                  "parameters": ",".join(data[CONF_PARAMETER]) if ALL_PARAMETERS not in data[CONF_PARAMETER] else None}
+        with interactive_requests():
+            await get_fetcher(hass).session.async_get_features(data[CONF_LANG], params, is_forecast is False)
 
     except FMIException:
         raise ConnectionProblem
@@ -44,7 +55,7 @@ async def validate_input(hass: HomeAssistant, data: dict[str, any]) -> str:
 
 
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
-    VERSION = 1
+    VERSION = 2
     data = None
     queries = None
     param_schema = None
@@ -60,9 +71,9 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     async def async_step_query(self, user_input: dict[str, any] = None) -> FlowResult:
 
         if user_input is None:
-            session = FMISession()
-            self.queries = await self.hass.async_add_executor_job(session.list_stored_queries, self.data[CONF_LANG],
-                                                                  "::simple")
+            with interactive_requests():
+                self.queries = await get_fetcher(self.hass).session.async_list_stored_queries(
+                    self.data[CONF_LANG], STORED_QUERY_SUFFIXES)
             schema = vol.Schema({
                 vol.Required(CONF_QUERY_LABEL): vol.All(cv.string,
                                                         vol.In([f"{query[1]} ({query[0]})" for query in self.queries])),
@@ -73,10 +84,48 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             return self.async_show_form(step_id="query", data_schema=schema, description_placeholders={
                 "url": f"https://opendata.fmi.fi/wfs/{self.data[CONF_LANG]}?request=getFeature&storedquery_id=fmi::ef::stations"})
 
-        user_input[CONF_QUERY_ID] = next(
-            (query[0] for query in self.queries if str(user_input[CONF_QUERY_LABEL]).startswith(query[1])), None)
+        user_input[CONF_QUERY_ID] = next((query[0] for query in self.queries
+                                          if user_input[CONF_QUERY_LABEL] == f"{query[1]} ({query[0]})"), None)
         self.data.update(user_input)
 
+        if self.data[CONF_TARGET_TYPE] in ("latlon", "place") and "::forecast" not in str(self.data[CONF_QUERY_ID]) \
+                and not str(self.data[CONF_QUERY_ID]).startswith("stuk::"):
+            return await self.async_step_station()
+
+        return await self.async_step_params()
+
+    async def async_step_station(self, user_input: dict[str, any] = None) -> FlowResult:
+
+        if user_input is None:
+            try:
+                with interactive_requests():
+                    index = await get_stations(self.hass).async_get_index(self.data[CONF_LANG])
+            except FMIException as exception:
+                _LOGGER.debug(f"Could not suggest FMI stations ({exception})")
+                return await self.async_step_params()
+
+            networks = get_query_networks(str(self.data[CONF_QUERY_ID]), index.networks)
+            latlon = parse_latlon(self.data[CONF_TARGET]) if self.data[CONF_TARGET_TYPE] == "latlon" else None
+            if latlon is not None:
+                found = index.nearest(latlon[0], latlon[1], STATION_SUGGESTIONS, networks, STATION_SEARCH_RADIUS)
+                stations = {station.fmisid: f"{station.name} ({station.fmisid}, {distance:.1f} km)"
+                            for distance, station in found}
+            else:
+                stations = {station.fmisid: f"{station.name} ({station.fmisid})"
+                            for station in index.search(self.data[CONF_TARGET], networks)[:STATION_SUGGESTIONS]}
+
+            if len(stations) == 0:
+                return await self.async_step_params()
+
+            choices = {KEEP_TARGET: f"{self.data[CONF_TARGET]} ({self.data[CONF_TARGET_TYPE]})", **stations}
+            return self.async_show_form(step_id="station", data_schema=vol.Schema({
+                vol.Required(CONF_STATION, default=next(iter(stations))): vol.In(choices),
+            }))
+
+        if user_input[CONF_STATION] != KEEP_TARGET:
+            self.data[CONF_TARGET_TYPE] = "fmisid"
+            self.data[CONF_TARGET] = user_input[CONF_STATION]
+
         return await self.async_step_params()
 
     async def async_step_params(self, user_input: dict[str, any] = None) -> FlowResult:
@@ -91,6 +140,13 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 schema_params[vol.Required(CONF_FORECAST_HOURS, default=36)] = cv.positive_int
                 schema_params[vol.Required(CONF_FORECAST_PAST_HOURS, default=5)] = cv.positive_int
                 schema_params[vol.Required(CONF_FORECAST_STEP, default=30)] = cv.positive_int
+                schema_params[vol.Required(CONF_FORECAST_ATTRIBUTE, default=FORECAST_ATTRIBUTE_FULL)] = vol.All(
+                    cv.string, vol.In(FORECAST_ATTRIBUTE_MODES))
+                schema_params[vol.Required(CONF_RECORD_FORECAST, default=True)] = cv.boolean
+                schema_params[vol.Required(CONF_FORECAST_POINTS, default=DEFAULT_FORECAST_POINTS)] = \
+                    cv.positive_int
+                schema_params[vol.Required(CONF_FORECAST_AGGREGATE, default=FORECAST_AGGREGATE_MEAN)] = vol.All(
+                    cv.string, vol.In(FORECAST_AGGREGATE_MODES))
 
             self.param_schema = vol.Schema(schema_params)
 
@@ -105,12 +161,16 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
         errors = {}
 
+        user_input[CONF_PARAMETER] = parse_parameters(user_input[CONF_PARAMETER])
+
         try:
             all_data = self.data.copy()
             all_data.update(user_input)
             await validate_input(self.hass, all_data)
         except ConnectionProblem:
             errors["base"] = "connection_problem"
+        except NoParameters:
+            errors["base"] = "no_parameters"
         except Exception:
             _LOGGER.exception("Unexpected exception")
             errors["base"] = "unknown"
@@ -147,6 +207,19 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                                      default=self._config_entry.data.get(CONF_FORECAST_HOURS)): cv.positive_int,
                         vol.Required(CONF_FORECAST_PAST_HOURS,
                                      default=self._config_entry.data.get(CONF_FORECAST_PAST_HOURS)): cv.positive_int,
+                        vol.Required(CONF_FORECAST_ATTRIBUTE,
+                                     default=self._config_entry.data.get(CONF_FORECAST_ATTRIBUTE,
+                                                                         FORECAST_ATTRIBUTE_FULL)): vol.All(
+                            cv.string, vol.In(FORECAST_ATTRIBUTE_MODES)),
+                        vol.Required(CONF_RECORD_FORECAST,
+                                     default=self._config_entry.data.get(CONF_RECORD_FORECAST, True)): cv.boolean,
+                        vol.Required(CONF_FORECAST_POINTS,
+                                     default=self._config_entry.data.get(CONF_FORECAST_POINTS,
+                                                                         DEFAULT_FORECAST_POINTS)): cv.positive_int,
+                        vol.Required(CONF_FORECAST_AGGREGATE,
+                                     default=self._config_entry.data.get(CONF_FORECAST_AGGREGATE,
+                                                                         FORECAST_AGGREGATE_MEAN)): vol.All(
+                            cv.string, vol.In(FORECAST_AGGREGATE_MODES)),
                     })
             )
 
@@ -165,3 +238,7 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
 
 class ConnectionProblem(HomeAssistantError):
     """Error to indicate there is an issue with the connection"""
+
+
+class NoParameters(HomeAssistantError):
+    """Error to indicate no parameters were given"""
@@ -1,12 +1,68 @@
 DOMAIN = "fmi"
-API_DESCRIBE_STORED_QUERIES_URL = "https://opendata.fmi.fi/wfs/${lang}?request=describeStoredQueries"
-API_GET_FEATURE_URL = "https://opendata.fmi.fi/wfs/${lang}?request=getFeature"
-API_GET_PARAMS_URL = "https://opendata.fmi.fi/meta?observableProperty=${property}&language=${lang}"
+API_BASE_URL = "https://opendata.fmi.fi"
+API_DESCRIBE_STORED_QUERIES_URL = f"{API_BASE_URL}/wfs/${{lang}}?request=describeStoredQueries"
+API_GET_FEATURE_URL = f"{API_BASE_URL}/wfs/${{lang}}?request=getFeature"
+API_GET_PARAMS_URL = f"{API_BASE_URL}/meta?observableProperty=${{property}}&language=${{lang}}"
+API_PROBE_URL = f"{API_BASE_URL}/wfs?request=describeStoredQueries&storedquery_id=fmi::ef::stations"
+STATIONS_QUERY_ID = "fmi::ef::stations"
+STORED_QUERY_SUFFIXES = ("::simple", "::multipointcoverage")
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/106.0.5249.62 Safari/537.36"
 DEFAULT_SCAN_INTERVAL = 5
+INCREMENTAL_OVERLAP = 30
+BATCH_DELAY = 2
+# only entries polling in the same moment share a result, a retry for late data must reach FMI
+SHARED_RESULT_MAX_AGE = BATCH_DELAY + 5
+MAX_BATCH_SIZE = 20
+POLL_JITTER = 60
+MIN_POLL_INTERVAL = 1
+ERROR_BACKOFF_MIN = 1
+ERROR_BACKOFF_MAX = 60
+
+QUERY_CADENCES = [
+    ("stuk::", 60, 15),
+    ("::forecast", 60, 20),
+    ("::hourly", 60, 10),
+    ("::daily", 1440, 90),
+    ("::monthly", 1440, 180),
+    ("::yearly", 1440, 180),
+]
+DEFAULT_QUERY_CADENCE = (10, 3)
+UNIT_CACHE_MAX_AGE = 7
+STATION_CACHE_MAX_AGE = 7
+STATION_MATCH_DISTANCE = 0.5
+STATION_SEARCH_RADIUS = 50
+STATION_SUGGESTIONS = 10
+# station networks that serve a stored query, as fragments of the Finnish or English network titles
+QUERY_NETWORKS = [
+    ("::mareograph", ("mareogra",)),
+    ("::wave", ("aalto", "aallo", "poiju", "wave", "buoy")),
+    ("::radiation", ("säteily", "radiation")),
+    ("::airquality", ("ilmanlaatu", "air quality")),
+    ("::weather", ("sää", "weather", "aws", "synop")),
+]
+MAX_CONNECTIONS_PER_HOST = 4
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_REQUEST_BURST = 10
+DEFAULT_MAX_STALE = 180
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RESET_TIMEOUT = 60
+BREAKER_MAX_RESET_TIMEOUT = 900
+
+DATA_FETCHER = "fetcher"
+DATA_UNITS = "units"
+DATA_SNAPSHOTS = "snapshots"
+DATA_LIMITER = "limiter"
+DATA_STATIONS = "stations"
+DATA_CONFIG = "config"
+
+STORAGE_VERSION = 1
+STORAGE_KEY_UNITS = f"{DOMAIN}.units"
+STORAGE_KEY_SNAPSHOTS = f"{DOMAIN}.snapshots"
+STORAGE_KEY_STATIONS = f"{DOMAIN}.stations"
 
 LANGUAGES = ["eng", "fin"]
 TARGET_TYPES = ["fmisid", "place", "geoid", "latlon"]
+ALL_PARAMETERS = "*"
 
 CONF_LABEL = "label"
 CONF_LANG = "language"
@@ -15,6 +71,36 @@ CONF_QUERY_ID = "query_id"
 CONF_PARAMETER = "parameter"
 CONF_TARGET_TYPE = "target_type"
 CONF_TARGET = "target"
+CONF_STATION = "station"
 CONF_FORECAST_HOURS = "forecast_hours"
 CONF_FORECAST_PAST_HOURS = "forecast_past_hours"
 CONF_FORECAST_STEP = "forecast_step"
+CONF_FORECAST_ATTRIBUTE = "forecast_attribute"
+CONF_RECORD_FORECAST = "record_forecast"
+CONF_FORECAST_POINTS = "forecast_points"
+CONF_FORECAST_AGGREGATE = "forecast_aggregate"
+CONF_REQUESTS_PER_MINUTE = "requests_per_minute"
+CONF_REQUEST_BURST = "request_burst"
+CONF_MAX_STALE = "max_stale"
+
+FORECAST_ATTRIBUTE_FULL = "full"
+FORECAST_ATTRIBUTE_COMPACT = "compact"
+FORECAST_ATTRIBUTE_NONE = "none"
+FORECAST_ATTRIBUTE_MODES = [FORECAST_ATTRIBUTE_FULL, FORECAST_ATTRIBUTE_COMPACT, FORECAST_ATTRIBUTE_NONE]
+
+FORECAST_AGGREGATE_MEAN = "mean"
+FORECAST_AGGREGATE_MIN = "min"
+FORECAST_AGGREGATE_MAX = "max"
+FORECAST_AGGREGATE_MODES = [FORECAST_AGGREGATE_MEAN, FORECAST_AGGREGATE_MIN, FORECAST_AGGREGATE_MAX]
+DEFAULT_FORECAST_POINTS = 0
+
+SERVICE_GET_FORECAST = "get_forecast"
+SERVICE_BACKFILL = "backfill"
+
+BACKFILL_CHUNK_HOURS = 168
+BACKFILL_CONCURRENCY = 4
+
+EXPORT_CONCURRENCY = 8
+EXPORT_RETRIES = 3
+EXPORT_RETRY_DELAY = 2
+EXPORT_MAX_OUTAGE = 1800
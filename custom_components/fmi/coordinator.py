@@ -0,0 +1,156 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import logging
+import time
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .catalogue import FMIStationCatalogue
+from .const import DOMAIN, DEFAULT_SCAN_INTERVAL, CONF_QUERY_ID, CONF_LANG, CONF_PARAMETER, ALL_PARAMETERS, \
+    STATION_MATCH_DISTANCE
+from .fetcher import FMIFetcher, FMIQueryKey, batch_group, query_key
+from .scheduler import FMIPollScheduler
+from .session import FMIException, FMIUnavailable, select_parameters
+from .snapshot import FMISnapshotStore
+from .stats import FMIRequestStats
+from .units import FMIUnitCache
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def get_fingerprint(series: dict[str, Any]) -> int:
+    return hash((series["unit"], tuple(series["times"]), series["values"].tobytes()))
+
+
+def add_fingerprints(data: dict[str, Any]) -> None:
+    for series in data["parameters"].values():
+        series["fingerprint"] = get_fingerprint(series)
+
+    data["fingerprint"] = hash((data["latitude"], data["longitude"],
+                                tuple(series["fingerprint"] for series in data["parameters"].values())))
+
+
+class FMIDataUpdateCoordinator(DataUpdateCoordinator):
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry, fetcher: FMIFetcher, units: FMIUnitCache,
+                 snapshots: FMISnapshotStore, stations: FMIStationCatalogue, max_stale: timedelta):
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=entry.unique_id or DOMAIN,
+            update_interval=timedelta(minutes=DEFAULT_SCAN_INTERVAL),
+        )
+        self._entry = entry
+        self._fetcher = fetcher
+        self._units = units
+        self._snapshots = snapshots
+        self._stations = stations
+        self._max_stale = max_stale
+        self._key = query_key(entry.data)
+        self._scheduler = FMIPollScheduler(self._key.query_id, str(batch_group(self._key)))
+        self.last_refresh_duration: float | None = None
+        self.stats = FMIRequestStats()
+
+    async def async_restore_snapshot(self) -> bool:
+        snapshot = await self._snapshots.async_load(self._entry.entry_id)
+
+        if snapshot is None:
+            return False
+
+        add_fingerprints(snapshot)
+        snapshot["stale"] = True
+        self.data = snapshot
+        return True
+
+    @property
+    def fetcher(self) -> FMIFetcher:
+        return self._fetcher
+
+    @property
+    def key(self) -> FMIQueryKey:
+        return self._key
+
+    @property
+    def query_stats(self) -> FMIRequestStats:
+        return self._fetcher.session.stats.query(str(self._entry.data[CONF_QUERY_ID]))
+
+    async def _async_get_units(self, param_names: list[str]) -> dict[str, str | None]:
+        start = time.perf_counter()
+        try:
+            return await self._units.async_get_unit_map(self._entry.data[CONF_LANG],
+                                                        str(self._entry.data[CONF_QUERY_ID]), param_names)
+        finally:
+            self.stats.record_unit_lookup(time.perf_counter() - start)
+
+    def _get_stale_data(self) -> dict[str, Any] | None:
+        if self.data is None or self.data.get("updated") is None:
+            return None
+
+        if datetime.now(timezone.utc) - self.data["updated"] > self._max_stale:
+            return None
+
+        return {**self.data, "stale": True}
+
+    async def _async_resolve_target(self, data: dict[str, Any]) -> None:
+        if self._key.target_type == "fmisid" or self._key.is_forecast or self._key.query_id.startswith("stuk::") \
+                or data["latitude"] is None:
+            return
+
+        # FMI picks a station for place, geoid and latlon targets on every request; once we know which one answered,
+        # poll it by fmisid so the request is cheaper and can be batched with other stations
+        station = await self._stations.async_find_station(self._key.lang, float(data["latitude"]),
+                                                          float(data["longitude"]), STATION_MATCH_DISTANCE)
+        if station is not None:
+            _LOGGER.debug(f"Resolved FMI target {self._key.target_type}={self._key.target} to fmisid {station.fmisid}")
+            self._key = self._key._replace(target_type="fmisid", target=station.fmisid)
+            self._scheduler.set_group(str(batch_group(self._key)))
+
+    async def _async_update_data(self) -> dict[str, Any]:
+        data = self._entry.data
+        start = time.perf_counter()
+
+        try:
+            features, units = await asyncio.gather(
+                self._fetcher.async_get_features(self._key, self.stats),
+                self._async_get_units([param for param in data[CONF_PARAMETER] if param != ALL_PARAMETERS]))
+
+            result = select_parameters(features, data[CONF_PARAMETER])
+            missing = [name for name in result["parameters"].keys() if name not in units]
+            if len(missing) > 0:
+                units.update(await self._async_get_units(missing))
+
+        except FMIException as exception:
+            # a refresh turned away by the circuit breaker follows the breaker, not the backoff of failed requests
+            self.update_interval = self._scheduler.unavailable_interval(datetime.utcnow(), exception.retry_after) \
+                if isinstance(exception, FMIUnavailable) else self._scheduler.failure_interval()
+
+            stale = self._get_stale_data()
+            if stale is None:
+                raise UpdateFailed(str(exception)) from exception
+
+            if not self.data["stale"]:
+                _LOGGER.warning(f"Could not update FMI data, serving data from {stale['updated'].isoformat()} "
+                                f"until FMI is available again ({exception})")
+            return stale
+
+        finally:
+            self.last_refresh_duration = time.perf_counter() - start
+
+        for name, series in result["parameters"].items():
+            series["unit"] = units.get(name)
+
+        add_fingerprints(result)
+        result["updated"] = datetime.now(timezone.utc)
+        result["stale"] = False
+        await self._async_resolve_target(result)
+        self._snapshots.async_save(self._entry.entry_id, result)
+
+        newest = max((max(series["times"], default=None) for series in result["parameters"].values()
+                      if len(series["times"]) > 0), default=None)
+        self.update_interval = self._scheduler.next_interval(
+            datetime.utcnow(), newest.astimezone(timezone.utc).replace(tzinfo=None) if newest is not None else None)
+
+        return result
@@ -0,0 +1,35 @@
+from typing import Any
+
+from homeassistant.components.diagnostics import REDACTED, async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN, DATA_LIMITER, CONF_TARGET
+from .coordinator import FMIDataUpdateCoordinator
+
+TO_REDACT = {CONF_TARGET, "latitude", "longitude"}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    coord: FMIDataUpdateCoordinator = hass.data[DOMAIN][entry.entry_id]
+
+    return {
+        "entry": async_redact_data(entry.data, TO_REDACT),
+        "coordinator": {
+            "target_type": coord.key.target_type,
+            "target": coord.key.target if coord.key.target_type == "fmisid" else REDACTED,
+            "last_update_success": coord.last_update_success,
+            "update_interval": coord.update_interval.total_seconds() if coord.update_interval is not None else None,
+            "last_refresh_duration": coord.last_refresh_duration,
+            "updated": coord.data["updated"].isoformat()
+            if coord.data is not None and coord.data.get("updated") is not None else None,
+            "stale": coord.data.get("stale") if coord.data is not None else None,
+            "values": {name: len(series["values"]) for name, series in coord.data["parameters"].items()}
+            if coord.data is not None else None,
+        },
+        "entry_requests": coord.stats.as_dict(),
+        "query": coord.query_stats.as_dict(),
+        "session": coord.fetcher.session.stats.as_dict(),
+        "breakers": {host: breaker.as_dict() for host, breaker in coord.fetcher.session.breakers.items()},
+        "limiter_waiting": hass.data[DOMAIN][DATA_LIMITER].waiting,
+    }
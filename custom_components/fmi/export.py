@@ -0,0 +1,185 @@
+import asyncio
+import csv
+from datetime import datetime, timezone
+import logging
+import random
+from typing import Any, Iterable, NamedTuple, Protocol
+
+from .const import EXPORT_CONCURRENCY, EXPORT_RETRIES, EXPORT_RETRY_DELAY, EXPORT_MAX_OUTAGE
+from .fetcher import FMIQueryKey, get_chunks, get_request_params
+from .series import to_number
+from .session import FMISession, FMIException, FMIResponseError, FMIUnavailable
+
+_LOGGER = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ["target", "latitude", "longitude", "time", "parameter", "value"]
+
+
+class FMIExportJob(NamedTuple):
+    target_type: str
+    target: str
+    start: datetime
+    end: datetime
+    last: bool = True
+
+
+class FMIExportWriter(Protocol):
+    def write(self, columns: dict[str, list[Any]]) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+def get_export_jobs(target_type: str, targets: list[str], start: datetime, end: datetime,
+                    chunk_hours: int) -> list[FMIExportJob]:
+    return [FMIExportJob(target_type, target, chunk_start, chunk_end, chunk_end >= end)
+            for target in targets for chunk_start, chunk_end in get_chunks(start, end, chunk_hours)]
+
+
+def get_export_columns(target: str, features: dict[str, Any], before: datetime | None = None) -> dict[str, list[Any]]:
+    columns = {name: [] for name in EXPORT_COLUMNS}
+    latitude = to_number(features["latitude"])
+    longitude = to_number(features["longitude"])
+
+    for name, data in features["parameters"].items():
+        if before is not None:
+            data = [item for item in data if item["time"] < before]
+        columns["time"].extend(item["time"] for item in data)
+        columns["value"].extend(to_number(item["value"]) for item in data)
+        columns["parameter"].extend([name] * len(data))
+
+    count = len(columns["time"])
+    columns["target"] = [target] * count
+    columns["latitude"] = [latitude] * count
+    columns["longitude"] = [longitude] * count
+    return columns
+
+
+class FMICSVWriter:
+    """Appends export rows to a CSV file as each chunk arrives"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(EXPORT_COLUMNS)
+
+    def write(self, columns: dict[str, list[Any]]) -> None:
+        columns = dict(columns, time=[time.isoformat() for time in columns["time"]],
+                       value=["" if value != value else value for value in columns["value"]])
+        self._writer.writerows(zip(*(columns[name] for name in EXPORT_COLUMNS)))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class FMIParquetWriter:
+    """Writes each chunk as its own Parquet row group, so only one chunk is in memory at a time"""
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as exception:
+            raise FMIException("Parquet export needs pyarrow (pip install pyarrow)") from exception
+
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema([
+            ("target", pyarrow.string()),
+            ("latitude", pyarrow.float64()),
+            ("longitude", pyarrow.float64()),
+            ("time", pyarrow.timestamp("s", tz="UTC")),
+            ("parameter", pyarrow.string()),
+            ("value", pyarrow.float64()),
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write(self, columns: dict[str, list[Any]]) -> None:
+        if len(columns["time"]) > 0:
+            self._writer.write_table(self._pyarrow.Table.from_pydict(columns, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+EXPORT_WRITERS = {"csv": FMICSVWriter, "parquet": FMIParquetWriter}
+
+
+class FMIBulkDownloader:
+    """Downloads many stored-query chunks with a bounded number of workers and hands every parsed chunk to a writer
+    as soon as it arrives"""
+
+    def __init__(self, session: FMISession, writer: FMIExportWriter, lang: str, query_id: str,
+                 parameters: list[str] | None = None, concurrency: int = EXPORT_CONCURRENCY,
+                 retries: int = EXPORT_RETRIES, max_outage: float = EXPORT_MAX_OUTAGE):
+        self._session = session
+        self._writer = writer
+        self._lang = lang
+        self._query_id = query_id
+        self._parameters = parameters
+        self._concurrency = concurrency
+        self._retries = retries
+        self._max_outage = max_outage
+        self.completed = 0
+        self.rows = 0
+        self.failed: list[tuple[FMIExportJob, str]] = []
+
+    async def async_run(self, jobs: Iterable[FMIExportJob]) -> None:
+        queue: asyncio.Queue[FMIExportJob] = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+
+        await asyncio.gather(*[self._async_worker(queue) for _ in range(min(self._concurrency, queue.qsize()))])
+
+    async def _async_worker(self, queue: asyncio.Queue) -> None:
+        while not queue.empty():
+            job = queue.get_nowait()
+
+            features = await self._async_fetch(job)
+            if features is None:
+                continue
+
+            # FMI includes both ends of the period, so the end of a chunk is left to the chunk that starts there
+            columns = get_export_columns(job.target, features,
+                                         None if job.last else job.end.replace(tzinfo=timezone.utc))
+            self._writer.write(columns)
+            self.rows += len(columns["time"])
+            self.completed += 1
+
+    async def _async_fetch(self, job: FMIExportJob) -> dict[str, Any] | None:
+        key = FMIQueryKey(self._lang, self._query_id, job.target_type, job.target, None, None, None)
+        params = get_request_params(key, job.end, job.start, job.end)
+        params["parameters"] = ",".join(self._parameters) if self._parameters else None
+
+        attempt = 0
+        waited = 0.0
+        while True:
+            try:
+                return await self._session.async_get_features(self._lang, params, False)
+            except FMIUnavailable as exception:
+                # the breaker turned the request away without sending it, so wait for it instead of using an attempt,
+                # but only for so long when the host stays down
+                delay = exception.retry_after + random.uniform(1, EXPORT_RETRY_DELAY)
+                if waited + delay <= self._max_outage:
+                    _LOGGER.debug(f"Waiting {delay:.1f}s for FMI to come back ({exception})")
+                    await asyncio.sleep(delay)
+                    waited += delay
+                    continue
+
+                _LOGGER.warning(f"Giving up on {job.target_type}={job.target} {job.start} - {job.end} "
+                                f"after waiting {waited:.0f}s for FMI ({exception})")
+                self.failed.append((job, str(exception)))
+                return None
+            except FMIException as exception:
+                client_error = isinstance(exception, FMIResponseError) and 400 <= exception.status < 500 \
+                    and exception.status != 429
+                if attempt == self._retries or client_error:
+                    _LOGGER.warning(f"Giving up on {job.target_type}={job.target} {job.start} - {job.end} "
+                                    f"({exception})")
+                    self.failed.append((job, str(exception)))
+                    return None
+
+                delay = EXPORT_RETRY_DELAY * 2 ** attempt * random.uniform(1, 1.5)
+                _LOGGER.debug(f"Retrying {job.target_type}={job.target} in {delay:.1f}s ({exception})")
+                await asyncio.sleep(delay)
+                attempt += 1
@@ -0,0 +1,237 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import logging
+from typing import Any, NamedTuple
+
+from dateutil.relativedelta import relativedelta
+
+from .const import CONF_LANG, CONF_QUERY_ID, CONF_TARGET_TYPE, CONF_TARGET, CONF_FORECAST_HOURS, \
+    CONF_FORECAST_PAST_HOURS, CONF_FORECAST_STEP, SHARED_RESULT_MAX_AGE, INCREMENTAL_OVERLAP, BATCH_DELAY, \
+    MAX_BATCH_SIZE
+from .parser import empty_features
+from .session import FMISession, FMIException
+from .stats import FMIRequestStats
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class FMIQueryKey(NamedTuple):
+    lang: str
+    query_id: str
+    target_type: str
+    target: str
+    forecast_hours: int | None
+    forecast_past_hours: int | None
+    forecast_step: int | None
+
+    @property
+    def is_forecast(self) -> bool:
+        return "::forecast" in self.query_id
+
+
+def query_key(data: dict[str, Any]) -> FMIQueryKey:
+    is_forecast = "::forecast" in str(data[CONF_QUERY_ID])
+    return FMIQueryKey(data[CONF_LANG], str(data[CONF_QUERY_ID]), data[CONF_TARGET_TYPE], str(data[CONF_TARGET]),
+                       data.get(CONF_FORECAST_HOURS) if is_forecast else None,
+                       data.get(CONF_FORECAST_PAST_HOURS) if is_forecast else None,
+                       data.get(CONF_FORECAST_STEP) if is_forecast else None)
+
+
+def batch_group(key: FMIQueryKey) -> FMIQueryKey:
+    return key._replace(target="")
+
+
+def get_start_time(query_id: str, now: datetime, data: dict[str, Any]):
+    return now - timedelta(hours=data[CONF_FORECAST_PAST_HOURS]) if "::forecast" in query_id else \
+        now.replace(minute=0, second=0) - relativedelta(hours=1) if "::hourly" in query_id else \
+            now.replace(hour=0, minute=0, second=0) if "::daily" in query_id else \
+                now.replace(day=1, hour=0, minute=0, second=0) if "::monthly" in query_id else \
+                    now.replace(month=1, day=1, hour=0, minute=0, second=0) if "::yearly" in query_id else \
+                        now - timedelta(hours=12) if not query_id.startswith("stuk::") else None
+
+
+def get_newest_time(features: dict[str, Any]) -> datetime | None:
+    times = [data[0]["time"] for data in features["parameters"].values() if len(data) > 0]
+    return max(times).astimezone(timezone.utc).replace(tzinfo=None) if len(times) > 0 else None
+
+
+def merge_latest(previous: dict[str, Any], features: dict[str, Any], window_start: datetime) -> dict[str, Any]:
+    result = {"latitude": features["latitude"] or previous["latitude"],
+              "longitude": features["longitude"] or previous["longitude"], "query_id": features["query_id"],
+              "parameters": {}}
+
+    for name, data in previous["parameters"].items():
+        if len(data) > 0 and data[0]["time"].astimezone(timezone.utc).replace(tzinfo=None) >= window_start:
+            result["parameters"][name] = data
+
+    for name, data in features["parameters"].items():
+        old = result["parameters"].get(name)
+        if len(data) > 0 or old is None:
+            if old is None or len(old) == 0 or data[0]["time"] >= old[0]["time"]:
+                result["parameters"][name] = data
+
+    return result
+
+
+def get_chunks(start: datetime, end: datetime, hours: int) -> list[tuple[datetime, datetime]]:
+    chunks = []
+    chunk_start = start.replace(minute=0, second=0, microsecond=0)
+
+    while chunk_start < end:
+        chunk_end = min(chunk_start + timedelta(hours=hours), end)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+
+    return chunks
+
+
+def get_request_params(key: FMIQueryKey, now: datetime, start_time: datetime | None = None,
+                       end_time: datetime | None = None) -> dict[str, str]:
+    if start_time is None:
+        start_time = get_start_time(key.query_id, now, {CONF_FORECAST_PAST_HOURS: key.forecast_past_hours})
+    if end_time is None and key.is_forecast:
+        end_time = now + timedelta(hours=key.forecast_hours)
+    return {"starttime": start_time.strftime('%Y-%m-%d%%20%H:%M:%S') if start_time is not None else None,
+            "endtime": end_time.strftime('%Y-%m-%d%%20%H:%M:%S') if end_time is not None else None,
+            "timestep": key.forecast_step, "storedquery_id": key.query_id, key.target_type: key.target}
+
+
+class FMIFetcher:
+    """Shares getFeature downloads between all config entries asking for the same query and target, and batches
+    entries that differ only by target into a single multi-target request"""
+
+    def __init__(self, session: FMISession):
+        self._session = session
+        self._results: dict[FMIQueryKey, tuple[datetime, dict[str, Any], FMIRequestStats]] = {}
+        self._pending: dict[FMIQueryKey, asyncio.Future] = {}
+        self._latest: dict[FMIQueryKey, dict[str, Any]] = {}
+        self._positions: dict[tuple[str, str], tuple[str, str]] = {}
+        self._batches: dict[FMIQueryKey, list[FMIQueryKey]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def session(self) -> FMISession:
+        return self._session
+
+    def invalidate(self) -> None:
+        self._results.clear()
+
+    async def async_get_features(self, key: FMIQueryKey, stats: FMIRequestStats | None = None) -> dict[str, Any]:
+        # the download is added to the stats of every caller that used it, even when it was shared or batched
+        cached = self._results.get(key)
+        if cached is not None and datetime.utcnow() - cached[0] < timedelta(seconds=SHARED_RESULT_MAX_AGE):
+            self._session.stats.record_cache("features", True)
+            features, receipt = cached[1:]
+        else:
+            pending = self._pending.get(key)
+            self._session.stats.record_cache("features", pending is not None)
+            if pending is None:
+                pending = self._schedule(key)
+
+            try:
+                features, receipt = await asyncio.shield(pending)
+            except FMIException as exception:
+                if stats is not None:
+                    stats.record_error(str(exception))
+                raise
+
+        if stats is not None:
+            stats.add(receipt)
+        return features
+
+    def _schedule(self, key: FMIQueryKey) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[key] = future
+
+        if (key.target_type, key.target) not in self._positions:
+            self._start([key])
+            return future
+
+        group = batch_group(key)
+        batch = self._batches.get(group)
+
+        if batch is None:
+            batch = self._batches[group] = []
+            loop.call_later(BATCH_DELAY, self._start_batch, group)
+
+        batch.append(key)
+
+        if len(batch) >= MAX_BATCH_SIZE:
+            self._start_batch(group)
+
+        return future
+
+    def _start_batch(self, group: FMIQueryKey) -> None:
+        keys = self._batches.pop(group, None)
+        if keys:
+            self._start(keys)
+
+    def _start(self, keys: list[FMIQueryKey]) -> None:
+        task = asyncio.get_running_loop().create_task(self._async_run(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _async_run(self, keys: list[FMIQueryKey]) -> None:
+        try:
+            receipt = FMIRequestStats()
+            results = await self._async_fetch(keys, receipt)
+            for key in keys:
+                self._pending[key].set_result((results[key], receipt))
+
+        except Exception as exception:
+            for key in keys:
+                self._pending[key].set_exception(exception)
+
+        finally:
+            for key in keys:
+                self._pending.pop(key, None)
+
+    async def _async_fetch(self, keys: list[FMIQueryKey],
+                           receipt: FMIRequestStats) -> dict[FMIQueryKey, dict[str, Any]]:
+        key = keys[0]
+        now = datetime.utcnow()
+        window_start = get_start_time(key.query_id, now, {CONF_FORECAST_PAST_HOURS: key.forecast_past_hours})
+        incremental = not key.is_forecast and window_start is not None
+        previous = {}
+        start_times = []
+
+        for item in keys:
+            last = self._latest.get(item) if incremental else None
+            newest = get_newest_time(last) if last is not None else None
+            if newest is not None and newest - timedelta(minutes=INCREMENTAL_OVERLAP) > window_start:
+                previous[item] = last
+                start_times.append(newest - timedelta(minutes=INCREMENTAL_OVERLAP))
+            else:
+                start_times.append(None)
+
+        start_time = min(start_times) if None not in start_times else None
+        params = get_request_params(key, now, start_time)
+
+        if len(keys) == 1:
+            features = {key: await self._session.async_get_features(key.lang, params, key.is_forecast is False,
+                                                                    receipt)}
+            if features[key]["latitude"] is not None:
+                self._positions[(key.target_type, key.target)] = (features[key]["latitude"],
+                                                                  features[key]["longitude"])
+
+        else:
+            params[key.target_type] = [item.target for item in keys]
+            locations = await self._session.async_get_features_by_location(key.lang, params,
+                                                                           key.is_forecast is False, receipt)
+            features = {item: locations.get(self._positions[(item.target_type, item.target)],
+                                            empty_features(item.query_id)) for item in keys}
+
+        for stale in [k for k, v in self._results.items() if now - v[0] >= timedelta(seconds=SHARED_RESULT_MAX_AGE)]:
+            self._results.pop(stale)
+
+        for item in keys:
+            if item in previous:
+                features[item] = merge_latest(previous[item], features[item], window_start)
+
+            if incremental:
+                self._latest[item] = features[item]
+
+            self._results[item] = (now, features[item], receipt)
+
+        return features
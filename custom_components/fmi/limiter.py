@@ -0,0 +1,82 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+import heapq
+import itertools
+import time
+from typing import Iterator
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+REQUEST_PRIORITY: ContextVar[int] = ContextVar("fmi_request_priority", default=PRIORITY_BACKGROUND)
+
+
+@contextmanager
+def interactive_requests() -> Iterator[None]:
+    token = REQUEST_PRIORITY.set(PRIORITY_INTERACTIVE)
+    try:
+        yield
+    finally:
+        REQUEST_PRIORITY.reset(token)
+
+
+class FMIRequestLimiter:
+    """Process-wide token bucket for FMI requests; waiting requests are released by priority, then in arrival order"""
+
+    def __init__(self, requests_per_minute: float, burst: int):
+        self._rate = requests_per_minute / 60
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def async_acquire(self, priority: int | None = None) -> None:
+        self._refill()
+
+        if len(self._waiters) == 0 and self._tokens >= 1:
+            self._tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters,
+                       (REQUEST_PRIORITY.get() if priority is None else priority, next(self._counter), future))
+        self._schedule()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._tokens += 1
+            raise
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _schedule(self) -> None:
+        if self._timer is None and len(self._waiters) > 0:
+            delay = max(0.0, (1 - self._tokens) / self._rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self) -> None:
+        self._timer = None
+        self._refill()
+
+        while len(self._waiters) > 0 and self._tokens >= 1:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                self._tokens -= 1
+                future.set_result(None)
+
+        while len(self._waiters) > 0 and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+
+        self._schedule()
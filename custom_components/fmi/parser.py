@@ -0,0 +1,206 @@
+from array import array
+from datetime import datetime, timezone
+from typing import Any
+from xml.etree import ElementTree
+
+from dateutil.parser import isoparse
+
+WFS = "{http://www.opengis.net/wfs/2.0}"
+GML = "{http://www.opengis.net/gml/3.2}"
+BSWFS = "{http://xml.fmi.fi/schema/wfs/2.0}"
+GMLCOV = "{http://www.opengis.net/gmlcov/1.0}"
+SWE = "{http://www.opengis.net/swe/2.0}"
+
+MEMBER = f"{WFS}member"
+ELEMENT = f"{BSWFS}BsWfsElement"
+LOCATION = f"{BSWFS}Location"
+PARAMETER_NAME = f"{BSWFS}ParameterName"
+PARAMETER_VALUE = f"{BSWFS}ParameterValue"
+TIME = f"{BSWFS}Time"
+POS = f"{GML}Point/{GML}pos"
+COVERAGE = f"{GMLCOV}MultiPointCoverage"
+POSITIONS = f"{GMLCOV}positions"
+TUPLE_LIST = f"{GML}doubleOrNilReasonTupleList"
+FIELD = f"{SWE}field"
+
+COVERAGE_SUFFIX = "::multipointcoverage"
+
+READ_CHUNK_SIZE = 16384
+
+
+def parse_time(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return isoparse(value)
+
+
+class FeatureParser:
+    """Incremental parser for BsWfsElement documents that drops every member once it has been read"""
+
+    def __init__(self, query_id: str, get_latest: bool, by_location: bool = False):
+        self._parser = ElementTree.XMLPullParser(events=("start", "end"))
+        self._root = None
+        self._query_id = query_id
+        self._get_latest = get_latest
+        self._by_location = by_location
+        self.members = 0
+        self.result = empty_features(query_id)
+        self.locations: dict[tuple[str, str], dict[str, Any]] = {}
+
+    def feed(self, data: bytes) -> None:
+        self._parser.feed(data)
+        self._process()
+
+    def close(self) -> Any:
+        self._parser.close()
+        self._process()
+        return self.locations if self._by_location else self.result
+
+    def _process(self) -> None:
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+            elif elem.tag == ELEMENT:
+                self._handle_element(elem)
+            elif elem.tag == MEMBER and self._root is not None:
+                self._root.remove(elem)
+
+    def _handle_element(self, elem: ElementTree.Element) -> None:
+        name = time = value = None
+        result = self.result
+        self.members += 1
+
+        for child in elem:
+            if child.tag == PARAMETER_NAME:
+                name = child.text.lower()
+            elif child.tag == TIME:
+                time = child.text
+            elif child.tag == PARAMETER_VALUE:
+                value = child.text
+            elif child.tag == LOCATION and (self._by_location or result["latitude"] is None):
+                result = self._get_location(child.find(POS).text)
+
+        elem.clear()
+        self.result = result
+
+        if name is None:
+            return
+
+        data = result["parameters"].setdefault(name, [])
+
+        if value is None or value == "NaN":
+            return
+
+        time = parse_time(time)
+
+        if self._get_latest:
+            if len(data) > 0 and time < data[0]["time"]:
+                return
+            if len(data) == 0 or time > data[0]["time"]:
+                data.clear()
+
+        data.append({"time": time, "value": value})
+
+    def _get_location(self, pos: str) -> dict[str, Any]:
+        coords = tuple(pos.split()[:2])
+        result = self.locations.get(coords)
+
+        if result is None:
+            result = self.result if self.result["latitude"] is None else empty_features(self._query_id)
+            result["latitude"] = coords[0]
+            result["longitude"] = coords[1]
+            self.locations[coords] = result
+
+        return result
+
+
+class CoverageParser(FeatureParser):
+    """Incremental parser for MultiPointCoverage documents that decodes the position and value blocks of each
+    coverage in bulk instead of one element per value"""
+
+    def __init__(self, query_id: str, get_latest: bool, by_location: bool = False):
+        super().__init__(query_id, get_latest, by_location)
+        self._positions: list[str] = []
+        self._values: list[str] = []
+        self._fields: list[str] = []
+
+    def _process(self) -> None:
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+            elif elem.tag == POSITIONS:
+                self._positions = (elem.text or "").split()
+                elem.clear()
+            elif elem.tag == TUPLE_LIST:
+                self._values = (elem.text or "").split()
+                elem.clear()
+            elif elem.tag == FIELD:
+                self._fields.append(elem.attrib["name"].lower())
+            elif elem.tag == COVERAGE:
+                self._handle_coverage()
+                self._positions, self._values, self._fields = [], [], []
+            elif elem.tag == MEMBER and self._root is not None:
+                self._root.remove(elem)
+
+    def _handle_coverage(self) -> None:
+        width = len(self._fields)
+        if width == 0:
+            return
+
+        # positions are "lat lon epoch" triples, values one row of `width` columns per position
+        lats = self._positions[0::3]
+        lons = self._positions[1::3]
+        epochs = array("q", map(int, self._positions[2::3]))
+        count = min(len(epochs), len(self._values) // width)
+        columns = [self._values[column::width] for column in range(width)]
+        times = {epoch: datetime.fromtimestamp(epoch, timezone.utc) for epoch in set(epochs[:count])}
+        self.members += count * width
+
+        start = 0
+        while start < count:
+            end = start + 1
+            while end < count and lats[end] == lats[start] and lons[end] == lons[start]:
+                end += 1
+
+            if self._by_location or self.result["latitude"] is None:
+                self.result = self._get_location(f"{lats[start]} {lons[start]}")
+
+            for name, column in zip(self._fields, columns):
+                self._add_samples(self.result["parameters"].setdefault(name, []), epochs[start:end],
+                                  column[start:end], times)
+
+            start = end
+
+    def _add_samples(self, data: list[dict[str, Any]], epochs: array, values: list[str],
+                     times: dict[int, datetime]) -> None:
+        samples = [(epoch, value) for epoch, value in zip(epochs, values) if value != "NaN"]
+
+        if self._get_latest and len(samples) > 0:
+            newest = max(epoch for epoch, _ in samples)
+            if len(data) > 0 and times[newest] < data[0]["time"]:
+                return
+            if len(data) == 0 or times[newest] > data[0]["time"]:
+                data.clear()
+            samples = [(epoch, value) for epoch, value in samples if epoch == newest]
+
+        data.extend({"time": times[epoch], "value": value} for epoch, value in samples)
+
+
+def get_feature_parser(query_id: str, get_latest: bool, by_location: bool = False) -> FeatureParser:
+    if query_id.endswith(COVERAGE_SUFFIX):
+        return CoverageParser(query_id, get_latest, by_location)
+    return FeatureParser(query_id, get_latest, by_location)
+
+
+def empty_features(query_id: str) -> dict[str, Any]:
+    return {"latitude": None, "longitude": None, "query_id": query_id, "parameters": {}}
+
+
+def parse_features(content: bytes, query_id: str, get_latest: bool) -> dict[str, Any]:
+    parser = get_feature_parser(query_id, get_latest)
+    for offset in range(0, len(content), READ_CHUNK_SIZE):
+        parser.feed(content[offset:offset + READ_CHUNK_SIZE])
+    return parser.close()
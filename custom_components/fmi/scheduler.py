@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+import random
+import zlib
+
+from .const import QUERY_CADENCES, DEFAULT_QUERY_CADENCE, POLL_JITTER, MIN_POLL_INTERVAL, ERROR_BACKOFF_MIN, \
+    ERROR_BACKOFF_MAX
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def get_group_offset(group: str) -> float:
+    """Seconds into every POLL_JITTER window at which the queries of a batch group are polled"""
+    return zlib.crc32(group.encode()) % (POLL_JITTER * 1000) / 1000
+
+
+def get_query_cadence(query_id: str) -> tuple[timedelta, timedelta]:
+    cadence, delay = next(((cadence, delay) for suffix, cadence, delay in QUERY_CADENCES if suffix in query_id),
+                          DEFAULT_QUERY_CADENCE)
+    return timedelta(minutes=cadence), timedelta(minutes=delay)
+
+
+class FMIPollScheduler:
+    """Plans the next poll of a query from its publication cadence, and backs off on errors"""
+
+    def __init__(self, query_id: str, group: str = ""):
+        self._offset = get_group_offset(group or query_id)
+        self._is_forecast = "::forecast" in query_id
+        self._cadence, self._delay = get_query_cadence(query_id)
+        self._learned_cadence: timedelta | None = None
+        self._newest: datetime | None = None
+        self._failures = 0
+
+    def set_group(self, group: str) -> None:
+        self._offset = get_group_offset(group)
+
+    @property
+    def cadence(self) -> timedelta:
+        return self._learned_cadence or self._cadence
+
+    def next_interval(self, now: datetime, newest: datetime | None) -> timedelta:
+        self._failures = 0
+
+        if newest is not None and self._newest is not None and newest > self._newest:
+            observed = newest - self._newest
+            if self._cadence / 6 <= observed <= self._cadence:
+                self._learned_cadence = observed
+
+        if newest is not None:
+            self._newest = newest
+
+        if self._is_forecast or self._newest is None:
+            periods = (now - self._delay - EPOCH) // self.cadence + 1
+            expected = EPOCH + periods * self.cadence + self._delay
+        else:
+            expected = self._newest + self.cadence + self._delay
+            if expected <= now:
+                expected = now + min(self.cadence, max(self.cadence / 4, timedelta(minutes=2)))
+
+        return max(self._align(expected) - now, timedelta(minutes=MIN_POLL_INTERVAL))
+
+    def unavailable_interval(self, now: datetime, retry_after: float) -> timedelta:
+        # the request was never sent, so poll again as soon as the circuit breaker lets a probe through
+        expected = now + timedelta(seconds=retry_after)
+        return max(self._align(expected) - now, timedelta(minutes=MIN_POLL_INTERVAL))
+
+    def _align(self, expected: datetime) -> datetime:
+        # the jitter is the same for the whole batch group, so entries that expect the same data poll together
+        phase = ((expected - EPOCH).total_seconds() - self._offset) % POLL_JITTER
+        if phase > 0:
+            expected += timedelta(seconds=POLL_JITTER - phase)
+        return expected
+
+    def failure_interval(self) -> timedelta:
+        self._failures += 1
+        backoff = min(ERROR_BACKOFF_MIN * 2 ** (self._failures - 1), ERROR_BACKOFF_MAX)
+        return timedelta(minutes=backoff, seconds=random.uniform(0, POLL_JITTER))
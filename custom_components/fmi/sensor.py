@@ -1,13 +1,23 @@
 import logging
-from datetime import datetime
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Any
 
 from homeassistant.components.sensor import SensorStateClass, SensorEntity, SensorDeviceClass
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant, callback
+from homeassistant.const import EntityCategory, UnitOfInformation, UnitOfTime
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, ServiceCall, ServiceResponse, callback, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import entity_platform
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_track_point_in_utc_time
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, CoordinatorEntity
+from homeassistant.util import dt as dt_util
 
-from .const import DOMAIN, CONF_LABEL, CONF_QUERY_ID
+from .const import DOMAIN, CONF_LABEL, CONF_QUERY_ID, CONF_PARAMETER, CONF_FORECAST_ATTRIBUTE, CONF_RECORD_FORECAST, \
+    CONF_FORECAST_POINTS, CONF_FORECAST_AGGREGATE, FORECAST_ATTRIBUTE_FULL, FORECAST_ATTRIBUTE_COMPACT, \
+    FORECAST_AGGREGATE_MEAN, DEFAULT_FORECAST_POINTS, SERVICE_GET_FORECAST, ALL_PARAMETERS
+from .series import downsample, json_value, json_values
 
 _LOGGER = logging.getLogger(__name__)
 ATTRIBUTION = "Data provided by Finnish Meteorological Institute (FMI)"
@@ -16,93 +26,237 @@ ATTR_LATITUDE = "latitude"
 ATTR_LONGITUDE = "longitude"
 ATTR_QUERY_ID = "query_id"
 ATTR_PARAMETER = "parameter"
+ATTR_STALE = "stale"
 ATTR_FORECAST = "forecast"
 ATTR_TIME = "time"
 ATTR_VALUE = "value"
+ATTR_TIMES = "times"
+ATTR_VALUES = "values"
+
+DIAGNOSTIC_REQUESTS = "requests"
+DIAGNOSTIC_BYTES = "bytes"
+DIAGNOSTIC_REFRESH_DURATION = "refresh_duration"
+
+DIAGNOSTIC_SENSORS = {
+    DIAGNOSTIC_REQUESTS: ("requests", None, None),
+    DIAGNOSTIC_BYTES: ("bytes received", SensorDeviceClass.DATA_SIZE, UnitOfInformation.BYTES),
+    DIAGNOSTIC_REFRESH_DURATION: ("refresh duration", SensorDeviceClass.DURATION, UnitOfTime.SECONDS),
+}
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
     coord = hass.data[DOMAIN][entry.entry_id]
     query_id = entry.data.get(CONF_QUERY_ID)
     label = entry.data.get(CONF_LABEL)
+    parameters = entry.data.get(CONF_PARAMETER)
+    single = len(parameters) == 1 and ALL_PARAMETERS not in parameters
+    names = list(coord.data["parameters"].keys()) if ALL_PARAMETERS in parameters else \
+        [param.lower() for param in parameters]
+
+    if "::forecast" in query_id:
+        mode = entry.data.get(CONF_FORECAST_ATTRIBUTE, FORECAST_ATTRIBUTE_FULL)
+        sensor_class = FMIForecastSensor if entry.data.get(CONF_RECORD_FORECAST, True) else \
+            FMIUnrecordedForecastSensor
+        points = entry.data.get(CONF_FORECAST_POINTS, DEFAULT_FORECAST_POINTS)
+        method = entry.data.get(CONF_FORECAST_AGGREGATE, FORECAST_AGGREGATE_MEAN)
+        sensors = [sensor_class(coord, label, name, single, mode, points, method) for name in names]
+
+        platform = entity_platform.async_get_current_platform()
+        platform.async_register_entity_service(SERVICE_GET_FORECAST, {}, async_get_forecast,
+                                               supports_response=SupportsResponse.ONLY)
+    else:
+        sensors = [FMISensor(coord, label, name, single) for name in names]
+
+    async_add_entities(sensors + [FMIDiagnosticSensor(coord, label, kind) for kind in DIAGNOSTIC_SENSORS])
+
+
+async def async_get_forecast(entity: SensorEntity, call: ServiceCall) -> ServiceResponse:
+    # the service targets every FMI sensor, but only forecast sensors have a forecast to return
+    if not isinstance(entity, FMIForecastSensor):
+        raise HomeAssistantError(f"{entity.entity_id} is not an FMI forecast sensor")
+    return await entity.async_get_forecast()
 
-    sensor = FMIForecastSensor(coord, label) if "::forecast" in query_id else FMISensor(coord, label)
-    async_add_entities([sensor], update_before_add=True)
 
+def get_timestamp(time: datetime) -> float:
+    return (time if time.tzinfo is not None else time.replace(tzinfo=timezone.utc)).timestamp()
 
-class FMISensor(CoordinatorEntity, SensorEntity):
-    def __init__(self, coordinator: DataUpdateCoordinator, label: str):
+
+def get_forecast_attribute(data: dict[str, Any], mode: str, points: int = DEFAULT_FORECAST_POINTS,
+                           method: str = FORECAST_AGGREGATE_MEAN) -> Any:
+    if mode not in (FORECAST_ATTRIBUTE_FULL, FORECAST_ATTRIBUTE_COMPACT):
+        return None
+
+    times, values = downsample(data["times"], data["values"], points, method)
+    if mode == FORECAST_ATTRIBUTE_FULL:
+        return [{ATTR_TIME: time, ATTR_VALUE: value} for time, value in zip(times, json_values(values))]
+    return {ATTR_TIMES: times, ATTR_VALUES: json_values(values)}
+
+
+class FMIParameterEntity(CoordinatorEntity):
+    def __init__(self, coordinator: DataUpdateCoordinator, label: str, parameter: str, single: bool):
         super().__init__(coordinator)
-        _attr_attribution = ATTRIBUTION
-        self._attr_icon = "mdi:weather-cloudy"
-        self._attr_state_class = SensorStateClass.MEASUREMENT
-        self._attr_unique_id = f"fmi_{label}"
-        self._attr_name = f"FMI {label}"
+        self._parameter = parameter
+        self._attr_unique_id = f"fmi_{label}" if single else f"fmi_{label}_{parameter}"
+        self._attr_name = f"FMI {label}" if single else f"FMI {label} {parameter}"
 
-        if coordinator.data["unit"] is not None:
-            self._attr_native_unit_of_measurement = coordinator.data["unit"]
+        if self._series["unit"] is not None:
+            self._attr_native_unit_of_measurement = self._series["unit"]
 
         self._attr_extra_state_attributes = {
             ATTR_LATITUDE: coordinator.data.get("latitude"),
             ATTR_LONGITUDE: coordinator.data.get("longitude"),
             ATTR_QUERY_ID: coordinator.data.get("query_id"),
-            ATTR_PARAMETER: coordinator.data.get("parameter"),
-            ATTR_TIME: coordinator.data["data"][0]["time"] if len(coordinator.data["data"]) > 0 else None,
-            ATTR_VALUE: coordinator.data["data"][0]["value"] if len(coordinator.data["data"]) > 0 else None,
+            ATTR_PARAMETER: self._series["parameter"],
+            ATTR_STALE: coordinator.data.get("stale", False),
         }
 
+        self._fingerprint = self._series.get("fingerprint")
+        self._written_available = coordinator.last_update_success
+
+    def _has_changed(self) -> bool:
+        fingerprint = self._series.get("fingerprint")
+        available = self.available
+        stale = self.coordinator.data.get("stale", False)
+
+        if fingerprint is not None and fingerprint == self._fingerprint and available == self._written_available \
+                and stale == self._attr_extra_state_attributes[ATTR_STALE]:
+            return False
+
+        self._fingerprint = fingerprint
+        self._written_available = available
+        self._attr_extra_state_attributes[ATTR_STALE] = stale
+        return True
+
+    @property
+    def _series(self) -> dict[str, Any]:
+        return self.coordinator.data["parameters"].get(self._parameter) or {
+            "parameter": self._parameter, "unit": None, "times": [], "values": []}
+
+
+class FMISensor(FMIParameterEntity, SensorEntity):
+    def __init__(self, coordinator: DataUpdateCoordinator, label: str, parameter: str, single: bool = True):
+        super().__init__(coordinator, label, parameter, single)
+        _attr_attribution = ATTRIBUTION
+        self._attr_icon = "mdi:weather-cloudy"
+        self._attr_state_class = SensorStateClass.MEASUREMENT
+        self._update_latest_attributes()
+
+    def _update_latest_attributes(self) -> None:
+        series = self._series
+        self._attr_extra_state_attributes[ATTR_TIME] = series["times"][-1] if len(series["times"]) > 0 else None
+        self._attr_extra_state_attributes[ATTR_VALUE] = json_value(series["values"][-1]) \
+            if len(series["values"]) > 0 else None
+
     @callback
     def _handle_coordinator_update(self) -> None:
-        self._attr_extra_state_attributes[ATTR_TIME] = self.coordinator.data["data"][0]["time"] if len(
-            self.coordinator.data["data"]) > 0 else None
-        self._attr_extra_state_attributes[ATTR_VALUE] = self.coordinator.data["data"][0]["value"] if len(
-            self.coordinator.data["data"]) > 0 else None
+        if not self._has_changed():
+            return
+
+        self._update_latest_attributes()
         self.async_write_ha_state()
 
     @property
     def native_value(self):
-        return self.coordinator.data["data"][0]["value"] if len(self.coordinator.data["data"]) > 0 else None
+        series = self._series
+        return json_value(series["values"][-1]) if len(series["values"]) > 0 else None
 
 
-class FMIForecastSensor(CoordinatorEntity, SensorEntity):
-    def __init__(self, coordinator: DataUpdateCoordinator, label: str):
-        super().__init__(coordinator)
+class FMIForecastSensor(FMIParameterEntity, SensorEntity):
+    def __init__(self, coordinator: DataUpdateCoordinator, label: str, parameter: str, single: bool = True,
+                 mode: str = FORECAST_ATTRIBUTE_FULL, points: int = DEFAULT_FORECAST_POINTS,
+                 method: str = FORECAST_AGGREGATE_MEAN):
+        super().__init__(coordinator, label, parameter, single)
         _attr_attribution = ATTRIBUTION
         self._attr_icon = "mdi:weather-cloudy-clock"
         self._attr_state_class = SensorStateClass.MEASUREMENT
-        self._attr_unique_id = f"fmi_{label}"
-        self._attr_name = f"FMI {label}"
+        self._mode = mode
+        self._points = points
+        self._method = method
+        self._index: list[float] = []
+        self._unsub_step: CALLBACK_TYPE | None = None
+        self._update_forecast_attribute()
 
-        if coordinator.data["unit"] is not None:
-            self._attr_native_unit_of_measurement = coordinator.data["unit"]
+    def _update_forecast_attribute(self) -> None:
+        series = self._series
+        self._index = [get_timestamp(time) for time in series["times"]]
 
-        self._attr_extra_state_attributes = {
-            ATTR_LATITUDE: coordinator.data.get("latitude"),
-            ATTR_LONGITUDE: coordinator.data.get("longitude"),
-            ATTR_QUERY_ID: coordinator.data.get("query_id"),
-            ATTR_PARAMETER: coordinator.data.get("parameter"),
-            ATTR_FORECAST: []
-        }
+        forecast = get_forecast_attribute(series, self._mode, self._points, self._method)
+        if forecast is not None:
+            self._attr_extra_state_attributes[ATTR_FORECAST] = forecast
 
-        if len(coordinator.data["data"]) > 0:
-            for entry in coordinator.data["data"]:
-                self._attr_extra_state_attributes[ATTR_FORECAST].append(
-                    {ATTR_TIME: entry["time"], ATTR_VALUE: entry["value"]})
+    def _schedule_step(self) -> None:
+        if self._unsub_step is not None:
+            self._unsub_step()
+            self._unsub_step = None
+
+        position = bisect_right(self._index, dt_util.utcnow().timestamp())
+        if position < len(self._index):
+            self._unsub_step = async_track_point_in_utc_time(
+                self.hass, self._async_step, dt_util.utc_from_timestamp(self._index[position]))
 
     @callback
-    def _handle_coordinator_update(self) -> None:
-        self._attr_extra_state_attributes[ATTR_FORECAST] = []
+    def _async_step(self, _now: datetime) -> None:
+        self._unsub_step = None
+        self.async_write_ha_state()
+        self._schedule_step()
 
-        if len(self.coordinator.data["data"]) > 0:
-            for entry in self.coordinator.data["data"]:
-                self._attr_extra_state_attributes[ATTR_FORECAST].append(
-                    {ATTR_TIME: entry["time"], ATTR_VALUE: entry["value"]})
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self._schedule_step()
 
+    async def async_will_remove_from_hass(self) -> None:
+        if self._unsub_step is not None:
+            self._unsub_step()
+            self._unsub_step = None
+        await super().async_will_remove_from_hass()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        if not self._has_changed():
+            return
+
+        self._update_forecast_attribute()
         self.async_write_ha_state()
+        self._schedule_step()
+
+    async def async_get_forecast(self) -> dict[str, Any]:
+        return {ATTR_FORECAST: get_forecast_attribute(self._series, FORECAST_ATTRIBUTE_FULL)}
+
+    @property
+    def native_value(self):
+        position = bisect_right(self._index, dt_util.utcnow().timestamp())
+        values = self._series["values"]
+        return json_value(values[position]) if position < len(values) else None
+
+
+class FMIUnrecordedForecastSensor(FMIForecastSensor):
+    _unrecorded_attributes = frozenset({ATTR_FORECAST})
+
+
+class FMIDiagnosticSensor(CoordinatorEntity, SensorEntity):
+    def __init__(self, coordinator: DataUpdateCoordinator, label: str, kind: str):
+        super().__init__(coordinator)
+        name, device_class, unit = DIAGNOSTIC_SENSORS[kind]
+        self._attr_icon = "mdi:chart-line"
+        self._attr_entity_category = EntityCategory.DIAGNOSTIC
+        self._attr_entity_registry_enabled_default = False
+        self._attr_state_class = SensorStateClass.MEASUREMENT if kind == DIAGNOSTIC_REFRESH_DURATION else \
+            SensorStateClass.TOTAL_INCREASING
+        self._attr_device_class = device_class
+        self._attr_native_unit_of_measurement = unit
+        self._attr_unique_id = f"fmi_{label}_{kind}"
+        self._attr_name = f"FMI {label} {name}"
+        self._kind = kind
 
     @property
     def native_value(self):
-        now = datetime.utcnow()
-        return next(
-            (entry["value"] for entry in self.coordinator.data["data"] if entry["time"].replace(tzinfo=None) > now),
-            None) if len(self.coordinator.data["data"]) > 0 else None
+        if self._kind == DIAGNOSTIC_REQUESTS:
+            return self.coordinator.stats.requests
+        if self._kind == DIAGNOSTIC_BYTES:
+            return self.coordinator.stats.bytes
+        return round(self.coordinator.last_refresh_duration, 3) \
+            if self.coordinator.last_refresh_duration is not None else None
+
+    @property
+    def extra_state_attributes(self):
+        return self.coordinator.stats.as_dict() if self._kind == DIAGNOSTIC_REQUESTS else None
@@ -0,0 +1,70 @@
+from array import array
+from datetime import datetime, timedelta
+import math
+from typing import Any, Iterable
+
+from .const import FORECAST_AGGREGATE_MEAN, FORECAST_AGGREGATE_MIN, FORECAST_AGGREGATE_MAX
+
+NAN = float("nan")
+
+
+def to_number(value: Any) -> float:
+    try:
+        return float(value) if value is not None else NAN
+    except (TypeError, ValueError):
+        return NAN
+
+
+def to_values(values: Iterable[Any]) -> array:
+    return array("d", (to_number(value) for value in values))
+
+
+def json_value(value: float) -> float | None:
+    return None if value != value else value
+
+
+def json_values(values: Iterable[float]) -> list[float | None]:
+    return [None if value != value else value for value in values]
+
+
+def get_bucket_minutes(times: list[datetime], max_points: int) -> int:
+    span = (times[-1] - times[0]).total_seconds() / 60
+    step = min((int((later - earlier).total_seconds() // 60) for earlier, later in zip(times, times[1:])
+                if later > earlier), default=1) or 1
+    # buckets are counted from the first time, so floor(span / size) + 1 <= max_points once size > span / max_points
+    return math.ceil((int(span // max_points) + 1) / step) * step
+
+
+def aggregate(values: list[float], method: str) -> float:
+    numbers = [value for value in values if value == value]
+    if len(numbers) == 0:
+        return NAN
+    if method == FORECAST_AGGREGATE_MIN:
+        return min(numbers)
+    if method == FORECAST_AGGREGATE_MAX:
+        return max(numbers)
+    return sum(numbers) / len(numbers)
+
+
+def downsample(times: list[datetime], values: array, max_points: int,
+               method: str = FORECAST_AGGREGATE_MEAN) -> tuple[list[datetime], array]:
+    if max_points <= 0 or len(times) <= max_points:
+        return times, values
+
+    size = timedelta(minutes=get_bucket_minutes(times, max_points))
+    first = times[0]
+    bucket_times = []
+    bucket_values = array("d")
+    start = 0
+
+    while start < len(times):
+        bucket = (times[start] - first) // size
+        end = start + 1
+        while end < len(times) and (times[end] - first) // size == bucket:
+            end += 1
+
+        bucket_times.append(first + bucket * size)
+        bucket_values.append(aggregate(values[start:end], method))
+        start = end
+
+    return bucket_times, bucket_values
@@ -0,0 +1,60 @@
+from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import entity_registry as er
+import homeassistant.helpers.config_validation as cv
+from homeassistant.util import dt as dt_util
+import voluptuous as vol
+
+from .backfill import async_backfill
+from .const import DOMAIN, DATA_FETCHER, CONF_LABEL, CONF_PARAMETER, CONF_QUERY_ID, SERVICE_BACKFILL
+from .session import FMIException
+
+ATTR_START = "start"
+ATTR_END = "end"
+
+BACKFILL_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_ENTITY_ID): cv.entity_id,
+        vol.Required(ATTR_START): cv.datetime,
+        vol.Optional(ATTR_END): cv.datetime,
+    }
+)
+
+
+def async_register_services(hass: HomeAssistant) -> None:
+
+    async def async_handle_backfill(call: ServiceCall) -> ServiceResponse:
+        entity = er.async_get(hass).async_get(call.data[ATTR_ENTITY_ID])
+
+        if entity is None or entity.platform != DOMAIN or entity.config_entry_id not in hass.data.get(DOMAIN, {}):
+            raise HomeAssistantError(f"{call.data[ATTR_ENTITY_ID]} is not a loaded FMI sensor")
+
+        entry = hass.config_entries.async_get_entry(entity.config_entry_id)
+
+        if "::forecast" in str(entry.data[CONF_QUERY_ID]):
+            raise HomeAssistantError("Backfill is only supported for observation queries")
+
+        prefix = f"fmi_{entry.data[CONF_LABEL]}_"
+        parameter = entity.unique_id[len(prefix):] if entity.unique_id.startswith(prefix) else \
+            entry.data[CONF_PARAMETER][0]
+
+        data = hass.data[DOMAIN][entry.entry_id].data
+        series = data["parameters"].get(parameter.lower()) if data is not None else None
+
+        # the diagnostic sensors share the unique id prefix, but have no FMI parameter to import
+        if entity.entity_category is not None or (data is not None and series is None):
+            raise HomeAssistantError(f"{call.data[ATTR_ENTITY_ID]} is not an FMI parameter sensor")
+
+        start = dt_util.as_utc(call.data[ATTR_START])
+        end = dt_util.as_utc(call.data[ATTR_END]) if ATTR_END in call.data else dt_util.utcnow()
+
+        try:
+            return await async_backfill(hass, entry, hass.data[DOMAIN][DATA_FETCHER], parameter,
+                                        call.data[ATTR_ENTITY_ID], series["unit"] if series is not None else None,
+                                        start, end)
+        except FMIException as exception:
+            raise HomeAssistantError(f"Backfill failed: {exception}") from exception
+
+    hass.services.async_register(DOMAIN, SERVICE_BACKFILL, async_handle_backfill, schema=BACKFILL_SCHEMA,
+                                 supports_response=SupportsResponse.OPTIONAL)
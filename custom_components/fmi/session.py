@@ -1,182 +1,400 @@
+import asyncio
 import logging
-from typing import Any
+import time
+from typing import Any, Callable
+from urllib.parse import urlsplit
 from xml.etree import ElementTree
-import requests
-from dateutil.parser import isoparse
-from requests import ConnectTimeout, RequestException
-from .const import USER_AGENT, API_DESCRIBE_STORED_QUERIES_URL, API_GET_FEATURE_URL, API_GET_PARAMS_URL
+
+import aiohttp
+
+from .breaker import FMICircuitBreaker, PERMIT_PROBE, PERMIT_REQUEST
+from .const import USER_AGENT, API_BASE_URL, API_DESCRIBE_STORED_QUERIES_URL, API_GET_FEATURE_URL, API_GET_PARAMS_URL, \
+    API_PROBE_URL, MAX_CONNECTIONS_PER_HOST, ALL_PARAMETERS, STATIONS_QUERY_ID
+from .limiter import FMIRequestLimiter
+from .parser import FeatureParser, READ_CHUNK_SIZE, get_feature_parser
+from .series import to_values
+from .stations import FMIStation
+from .stats import FMIRequestStats, FMIStats
 
 _LOGGER = logging.getLogger(__name__)
 
+NAMESPACES = {
+    "wfs": "http://www.opengis.net/wfs/2.0",
+    "gml": "http://www.opengis.net/gml/3.2",
+    "BsWfs": "http://xml.fmi.fi/schema/wfs/2.0",
+    "xsi": "http://www.w3.org/2001/XMLSchema-instance",
+    "omop": "http://inspire.ec.europa.eu/schemas/omop/2.9",
+    "ef": "http://inspire.ec.europa.eu/schemas/ef/4.0",
+    "xlink": "http://www.w3.org/1999/xlink"
+}
+
 
 class FMIException(Exception):
     """Base exception for FMI"""
 
 
+class FMIUnavailable(FMIException):
+    """Request was not sent because the circuit breaker of the host is open"""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FMIResponseError(FMIException):
+    """FMI answered with an error status"""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
 class FMISession:
     _timeout: int
 
-    def __init__(self, timeout=20):
+    def __init__(self, timeout=20, session: aiohttp.ClientSession | None = None, base_url: str = API_BASE_URL,
+                 limiter: FMIRequestLimiter | None = None):
         self._timeout = timeout
+        self._base_url = base_url
+        self._limiter = limiter
+        self._inflight: dict[tuple, tuple[asyncio.Task, FMIRequestStats]] = {}
+        self._session = session
+        self._owns_session = session is None
+        self._semaphore = asyncio.Semaphore(MAX_CONNECTIONS_PER_HOST)
+        self.breakers: dict[str, FMICircuitBreaker] = {}
+        self.stats = FMIStats()
 
-    def get_feature(self, lang: str, params: dict[str, str], target_param: str, get_latest: bool) -> Any:
+    async def async_close(self) -> None:
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
 
-        try:
-            url = API_GET_FEATURE_URL.replace("${lang}", lang)
-            for key in params.keys():
-                if params[key] is not None and params[key] != "":
-                    url += f"&{key}={params[key]}"
+    async def async_get_feature(self, lang: str, params: dict[str, str], target_param: str,
+                                get_latest: bool) -> Any:
+        features, unit = await asyncio.gather(self.async_get_features(lang, params, get_latest),
+                                              self.async_get_unit_type(target_param, lang, params["storedquery_id"]))
 
-            _LOGGER.debug(f"Querying data from FMI API (url={url})")
+        result = select_parameter(features, target_param)
+        result["unit"] = unit
 
-            response = requests.get(
-                url=url,
-                headers={
-                    "User-Agent": USER_AGENT
-                },
-                timeout=self._timeout,
-            )
+        return result
 
-            if response.status_code != 200:
-                raise FMIException(f"{response.status_code} is not valid")
+    async def async_get_features(self, lang: str, params: dict[str, Any], get_latest: bool,
+                                 stats: FMIRequestStats | None = None) -> Any:
+        url = get_feature_url(lang, params, self._base_url)
 
-            else:
-                result = {"latitude": None, "longitude": None, "query_id": params["storedquery_id"],
-                          "parameter": target_param, "unit": None, "data": []}
+        _LOGGER.debug(f"Querying data from FMI API (url={url})")
 
-                namespaces = {
-                    "wfs": "http://www.opengis.net/wfs/2.0",
-                    "gml": "http://www.opengis.net/gml/3.2",
-                    "BsWfs": "http://xml.fmi.fi/schema/wfs/2.0",
-                    "xsi": "http://www.w3.org/2001/XMLSchema-instance"
-                }
+        return await self._async_get(url, params["storedquery_id"],
+                                     lambda: get_feature_parser(params["storedquery_id"], get_latest), get_latest,
+                                     stats)
 
-                tree = ElementTree.fromstring(response.text)
+    async def async_get_features_by_location(self, lang: str, params: dict[str, Any], get_latest: bool,
+                                             stats: FMIRequestStats | None = None) -> dict[tuple[str, str], Any]:
+        url = get_feature_url(lang, params, self._base_url)
 
-                for item in tree.findall("./wfs:member/BsWfs:BsWfsElement", namespaces):
+        _LOGGER.debug(f"Querying data for multiple locations from FMI API (url={url})")
 
-                    if result["latitude"] is None or result["longitude"] is None:
-                        coords = item.find("./BsWfs:Location/gml:Point/gml:pos", namespaces).text.rstrip().split(" ")
-                        result["latitude"] = coords[0]
-                        result["longitude"] = coords[1]
+        return await self._async_get(url, params["storedquery_id"],
+                                     lambda: get_feature_parser(params["storedquery_id"], get_latest, by_location=True),
+                                     ("by_location", get_latest), stats)
 
-                    name = item.find("./BsWfs:ParameterName", namespaces).text
+    async def async_list_stored_queries(self, lang: str, suffix: str | tuple[str, ...] = None) -> list[list[str]]:
+        url = API_DESCRIBE_STORED_QUERIES_URL.replace(API_BASE_URL, self._base_url).replace("${lang}", lang)
+        return await self._async_get(url, "describeStoredQueries",
+                                     lambda: lambda content: parse_stored_queries(content, suffix), suffix)
 
-                    if name.lower() != target_param.lower():
-                        continue
+    async def async_get_unit_type(self, param_name: str, lang: str, query_id: str) -> str:
+        if query_id.startswith("stuk::"):
+            return get_fixed_unit(query_id)
 
-                    time = isoparse(item.find("./BsWfs:Time", namespaces).text)
-                    value = item.find("./BsWfs:ParameterValue", namespaces).text
+        units = await self.async_get_units(lang, get_property_type(query_id))
+        return units.get(param_name.lower())
 
-                    if value != "NaN":
-                        if get_latest and (len(result["data"]) == 0 or time > result["data"][0]["time"]):
-                            result["data"] = []
-                        result["data"].append({"time": time, "value": value})
+    async def async_get_units(self, lang: str, property_type: str) -> dict[str, str]:
+        url = API_GET_PARAMS_URL.replace(API_BASE_URL, self._base_url).replace("${lang}", lang).replace(
+            "${property}", property_type)
+        return await self._async_get(url, f"meta:{property_type}", lambda: parse_units)
 
-                result["unit"] = self.get_unit_type(target_param, lang, params["storedquery_id"])
+    async def async_get_stations(self, lang: str) -> list[FMIStation]:
+        url = get_feature_url(lang, {"storedquery_id": STATIONS_QUERY_ID}, self._base_url)
+        return await self._async_get(url, STATIONS_QUERY_ID, lambda: parse_stations)
 
-                return result
+    def get_feature(self, lang: str, params: dict[str, str], target_param: str, get_latest: bool) -> Any:
+        return self._run_sync("async_get_feature", lang, params, target_param, get_latest)
 
-        except ConnectTimeout as exception:
-            raise FMIException("Timeout error") from exception
+    def get_features(self, lang: str, params: dict[str, str], get_latest: bool) -> Any:
+        return self._run_sync("async_get_features", lang, params, get_latest)
 
-        except RequestException as exception:
-            raise FMIException(f"Communication error {exception}") from exception
+    def list_stored_queries(self, lang: str, suffix: str | tuple[str, ...] = None) -> list[list[str]]:
+        return self._run_sync("async_list_stored_queries", lang, suffix)
 
-    def list_stored_queries(self, lang: str, suffix: str = None) -> list[list[str]]:
+    def get_unit_type(self, param_name: str, lang: str, query_id: str) -> str:
+        return self._run_sync("async_get_unit_type", param_name, lang, query_id)
+
+    def get_units(self, lang: str, property_type: str) -> dict[str, str]:
+        return self._run_sync("async_get_units", lang, property_type)
+
+    def _run_sync(self, method: str, *args) -> Any:
+        async def run():
+            session = FMISession(self._timeout, base_url=self._base_url)
+            try:
+                return await getattr(session, method)(*args)
+            finally:
+                await session.async_close()
+
+        return asyncio.run(run())
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=MAX_CONNECTIONS_PER_HOST))
+        return self._session
+
+    async def _async_get(self, url: str, name: str,
+                         parser_factory: Callable[[], FeatureParser | Callable[[bytes], Any]],
+                         variant: Any = None, stats: FMIRequestStats | None = None) -> Any:
+        key = (url, variant)
+        inflight = self._inflight.get(key)
+        self.stats.record_cache("requests", inflight is not None)
+
+        if inflight is None:
+            # every caller sharing the request is charged with it, so the request keeps its own statistics
+            receipt = FMIRequestStats()
+            task = asyncio.get_running_loop().create_task(self._async_request(url, name, parser_factory(), receipt))
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            task.add_done_callback(lambda done: self._inflight.pop(key, None))
+            inflight = self._inflight[key] = (task, receipt)
 
         try:
-            url = API_DESCRIBE_STORED_QUERIES_URL.replace("${lang}", lang)
-            response = requests.get(
-                url=url,
-                headers={
-                    "User-Agent": USER_AGENT
-                },
-                timeout=self._timeout,
-            )
-
-            if response.status_code != 200:
-                raise FMIException(f"{response.status_code} is not valid")
-
-            else:
-                data = []
-
-                namespaces = {
-                    "wfs": "http://www.opengis.net/wfs/2.0",
-                    "gml": "http://www.opengis.net/gml/3.2",
-                    "BsWfs": "http://xml.fmi.fi/schema/wfs/2.0",
-                    "xsi": "http://www.w3.org/2001/XMLSchema-instance"
-                }
-
-                root = ElementTree.fromstring(response.text)
-                for item in root.findall("./wfs:StoredQueryDescription", namespaces):
-                    if suffix is None or item.attrib["id"].endswith(suffix):
-                        for param in item.findall("./wfs:Parameter", namespaces):
-                            if param.attrib["name"] == "fmisid":
-                                data.append([item.attrib["id"], item.find("./wfs:Title", namespaces).text])
-                                break
-
-                def sort_query(val: list):
-                    return val[1]
-
-                data.sort(key=sort_query)
-
-                return data
-
-        except ConnectTimeout as exception:
-            raise FMIException("Timeout error") from exception
+            return await asyncio.shield(inflight[0])
+        finally:
+            if stats is not None:
+                stats.add(inflight[1])
+
+    def _get_breaker(self, url: str) -> FMICircuitBreaker:
+        host = urlsplit(url).netloc
+        if host not in self.breakers:
+            self.breakers[host] = FMICircuitBreaker()
+        return self.breakers[host]
+
+    async def _async_probe(self, url: str, breaker: FMICircuitBreaker) -> None:
+        parts = urlsplit(url)
+        probe_url = API_PROBE_URL.replace(API_BASE_URL, f"{parts.scheme}://{parts.netloc}")
+        _LOGGER.debug(f"Probing FMI API after outage (url={probe_url})")
 
-        except RequestException as exception:
-            raise FMIException(f"Communication error {exception}") from exception
-
-    def get_unit_type(self, param_name: str, lang: str, query_id: str) -> str:
+        try:
+            async with self._get_session().get(probe_url, headers={"User-Agent": USER_AGENT},
+                                               timeout=aiohttp.ClientTimeout(total=self._timeout)) as response:
+                status = response.status
+                await response.read()
+        except (asyncio.TimeoutError, aiohttp.ClientError) as exception:
+            breaker.record_failure(probe=True)
+            raise FMIUnavailable(f"{parts.netloc} is still unavailable ({exception})",
+                                 breaker.retry_after) from exception
+
+        if status >= 500 or status == 429:
+            breaker.record_failure(probe=True)
+            raise FMIUnavailable(f"{parts.netloc} is still unavailable ({status})", breaker.retry_after)
+
+        breaker.record_success()
+
+    async def _async_request(self, url: str, name: str, parser: FeatureParser | Callable[[bytes], Any],
+                             stats: FMIRequestStats) -> Any:
+        breaker = self._get_breaker(url)
+
+        permit = breaker.allow()
+        if permit is None:
+            stats.record_error("Circuit breaker open")
+            self.stats.query(name).add(stats)
+            raise FMIUnavailable(f"{urlsplit(url).netloc} is unavailable, request not sent", breaker.retry_after)
 
         try:
-            url = API_GET_PARAMS_URL.replace("${lang}", lang).replace("${property}",
-                                                                      "forecast" if "forecast::" in query_id else "observation")
-            response = requests.get(
-                url=url,
-                headers={
-                    "User-Agent": USER_AGENT
-                },
-                timeout=self._timeout,
-            )
-
-            if response.status_code != 200:
-                raise FMIException(f"{response.status_code} is not valid")
-
-            else:
-                namespaces = {
-                    "wfs": "http://www.opengis.net/wfs/2.0",
-                    "gml": "http://www.opengis.net/gml/3.2",
-                    "BsWfs": "http://xml.fmi.fi/schema/wfs/2.0",
-                    "xsi": "http://www.w3.org/2001/XMLSchema-instance",
-                    "omop": "http://inspire.ec.europa.eu/schemas/omop/2.9"
-                }
-
-                unit = None
-
-                if query_id.startswith("stuk::"):
-                    if "::air" in query_id:
-                        unit = "µBq/m³"
-                    elif "::external-radiation" in query_id:
-                        unit = "µSv/h"
-
-                else:
-                    root = ElementTree.fromstring(response.text)
-                    for component in root.findall("./omop:component", namespaces):
-                        prop = component.find("./omop:ObservableProperty", namespaces)
-                        if prop.attrib['{http://www.opengis.net/gml/3.2}id'] == param_name.lower():
-                            unit = prop.find("./omop:uom", namespaces).attrib["uom"]
-                            break
-
-                    if unit is not None:
-                        unit = unit.replace("degC", "°C")
-
-                return unit
-
-        except ConnectTimeout as exception:
+            if self._limiter is not None:
+                await self._limiter.async_acquire()
+
+                # the breaker may have opened while this request was queued for a token
+                if permit == PERMIT_REQUEST:
+                    permit = breaker.allow()
+                    if permit is None:
+                        raise FMIUnavailable(f"{urlsplit(url).netloc} became unavailable, request not sent",
+                                             breaker.retry_after)
+
+            if permit == PERMIT_PROBE:
+                await self._async_probe(url, breaker)
+
+            async with self._semaphore:
+                start = time.perf_counter()
+                async with self._get_session().get(
+                        url,
+                        headers={
+                            "User-Agent": USER_AGENT,
+                            "Accept-Encoding": "gzip, deflate"
+                        },
+                        timeout=aiohttp.ClientTimeout(total=self._timeout),
+                ) as response:
+                    connected = time.perf_counter()
+
+                    if response.status >= 500 or response.status == 429:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+
+                    if response.status != 200:
+                        raise FMIResponseError(f"{response.status} is not valid", response.status)
+
+                    if isinstance(parser, FeatureParser):
+                        size = 0
+                        parse = 0.0
+                        async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+                            size += len(chunk)
+                            parse_start = time.perf_counter()
+                            parser.feed(chunk)
+                            parse += time.perf_counter() - parse_start
+
+                        parse_start = time.perf_counter()
+                        result = parser.close()
+                        parse += time.perf_counter() - parse_start
+                        stats.record_request(connected - start, time.perf_counter() - connected - parse, parse,
+                                             get_received_bytes(response, size), parser.members)
+
+                    else:
+                        content = await response.read()
+                        downloaded = time.perf_counter()
+                        result = parser(content)
+                        stats.record_request(connected - start, downloaded - connected,
+                                             time.perf_counter() - downloaded,
+                                             get_received_bytes(response, len(content)), None)
+
+                    return result
+
+        except FMIException as exception:
+            stats.record_error(str(exception))
+            raise
+
+        except ElementTree.ParseError as exception:
+            stats.record_error(f"Invalid response {exception}")
+            raise FMIException(f"Invalid response {exception}") from exception
+
+        except asyncio.TimeoutError as exception:
+            breaker.record_failure()
+            stats.record_error("Timeout error")
             raise FMIException("Timeout error") from exception
 
-        except RequestException as exception:
+        except aiohttp.ClientError as exception:
+            breaker.record_failure()
+            stats.record_error(f"Communication error {exception}")
             raise FMIException(f"Communication error {exception}") from exception
+
+        finally:
+            if permit == PERMIT_PROBE:
+                breaker.release_probe()
+            self.stats.query(name).add(stats)
+
+
+def get_feature_url(lang: str, params: dict[str, Any], base_url: str = API_BASE_URL) -> str:
+    url = API_GET_FEATURE_URL.replace(API_BASE_URL, base_url).replace("${lang}", lang)
+    for key in params.keys():
+        for value in params[key] if isinstance(params[key], list) else [params[key]]:
+            if value is not None and value != "":
+                url += f"&{key}={value}"
+    return url
+
+
+def get_received_bytes(response: aiohttp.ClientResponse, decoded: int) -> int:
+    """Size of the response on the wire, before gzip or deflate was undone"""
+    raw = getattr(response.content, "total_raw_bytes", None)
+    if raw is not None:
+        return raw
+    return response.content_length if response.content_length is not None else decoded
+
+
+def parse_stored_queries(content: bytes, suffix: str | tuple[str, ...] = None) -> list[list[str]]:
+    data = []
+
+    root = ElementTree.fromstring(content)
+    for item in root.findall("./wfs:StoredQueryDescription", NAMESPACES):
+        if suffix is None or item.attrib["id"].endswith(suffix):
+            for param in item.findall("./wfs:Parameter", NAMESPACES):
+                if param.attrib["name"] == "fmisid":
+                    data.append([item.attrib["id"], item.find("./wfs:Title", NAMESPACES).text])
+                    break
+
+    def sort_query(val: list):
+        return val[1]
+
+    data.sort(key=sort_query)
+
+    return data
+
+
+def parse_units(content: bytes) -> dict[str, str]:
+    units = {}
+
+    root = ElementTree.fromstring(content)
+    for component in root.findall("./omop:component", NAMESPACES):
+        prop = component.find("./omop:ObservableProperty", NAMESPACES)
+        uom = prop.find("./omop:uom", NAMESPACES)
+        if uom is not None:
+            units[prop.attrib['{http://www.opengis.net/gml/3.2}id'].lower()] = uom.attrib["uom"].replace("degC", "°C")
+
+    return units
+
+
+def parse_stations(content: bytes) -> list[FMIStation]:
+    stations = []
+
+    root = ElementTree.fromstring(content)
+    for facility in root.findall("./wfs:member/ef:EnvironmentalMonitoringFacility", NAMESPACES):
+        fmisid = None
+        geoid = None
+        for identifier in facility.findall("./gml:identifier", NAMESPACES) + facility.findall("./gml:name",
+                                                                                                NAMESPACES):
+            if identifier.attrib.get("codeSpace", "").endswith("/fmisid"):
+                fmisid = identifier.text
+            elif identifier.attrib.get("codeSpace", "").endswith("/geoid"):
+                geoid = identifier.text
+
+        pos = facility.find("./ef:representativePoint/gml:Point/gml:pos", NAMESPACES)
+        if fmisid is None or pos is None:
+            continue
+
+        lat, lon = pos.text.split()[:2]
+        stations.append(FMIStation(
+            fmisid, facility.findtext("./ef:name", fmisid, NAMESPACES), geoid, float(lat), float(lon),
+            tuple(network.attrib[f"{{{NAMESPACES['xlink']}}}title"]
+                  for network in facility.findall("./ef:belongsTo", NAMESPACES)
+                  if f"{{{NAMESPACES['xlink']}}}title" in network.attrib)))
+
+    return stations
+
+
+def get_property_type(query_id: str) -> str:
+    return "forecast" if "forecast::" in query_id else "observation"
+
+
+def get_fixed_unit(query_id: str) -> str | None:
+    if "::air" in query_id:
+        return "µBq/m³"
+    elif "::external-radiation" in query_id:
+        return "µSv/h"
+    return None
+
+
+def select_parameter(features: dict[str, Any], target_param: str) -> dict[str, Any]:
+    data = sorted(features["parameters"].get(target_param.lower(), []), key=lambda item: item["time"])
+    return {"latitude": features["latitude"], "longitude": features["longitude"], "query_id": features["query_id"],
+            "parameter": target_param, "unit": None, "times": [item["time"] for item in data],
+            "values": to_values(item["value"] for item in data)}
+
+
+def select_parameters(features: dict[str, Any], target_params: list[str]) -> dict[str, Any]:
+    if ALL_PARAMETERS in target_params:
+        target_params = list(features["parameters"].keys())
+
+    return {"latitude": features["latitude"], "longitude": features["longitude"], "query_id": features["query_id"],
+            "parameters": {param.lower(): select_parameter(features, param) for param in target_params}}
+
+
+def parse_parameters(value: str) -> list[str]:
+    return [param.strip() for param in value.split(",") if param.strip() != ""]
@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .const import STORAGE_VERSION, STORAGE_KEY_SNAPSHOTS
+from .series import json_values, to_values
+
+SAVE_DELAY = 30
+
+
+def to_snapshot(data: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "latitude": data["latitude"],
+        "longitude": data["longitude"],
+        "query_id": data["query_id"],
+        "updated": int(data["updated"].timestamp()) if data.get("updated") is not None else None,
+        "parameters": {name: {"parameter": series["parameter"], "unit": series["unit"],
+                              "times": [int(time.timestamp()) for time in series["times"]],
+                              "values": json_values(series["values"])}
+                       for name, series in data["parameters"].items()},
+    }
+
+
+def from_snapshot(snapshot: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "latitude": snapshot["latitude"],
+        "longitude": snapshot["longitude"],
+        "query_id": snapshot["query_id"],
+        "updated": datetime.fromtimestamp(snapshot["updated"], timezone.utc)
+        if snapshot.get("updated") is not None else None,
+        "parameters": {name: {"parameter": series["parameter"], "unit": series["unit"],
+                              "times": [datetime.fromtimestamp(time, timezone.utc) for time in series["times"]],
+                              "values": to_values(series["values"])}
+                       for name, series in snapshot["parameters"].items()},
+    }
+
+
+class FMISnapshotStore:
+    """Last successfully parsed payload of every entry, kept on disk so entities can be created before FMI answers"""
+
+    def __init__(self, hass: HomeAssistant):
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY_SNAPSHOTS)
+        self._snapshots: dict[str, dict[str, Any]] | None = None
+
+    async def _async_load_all(self) -> dict[str, dict[str, Any]]:
+        if self._snapshots is None:
+            self._snapshots = await self._store.async_load() or {}
+        return self._snapshots
+
+    async def async_load(self, entry_id: str) -> dict[str, Any] | None:
+        snapshot = (await self._async_load_all()).get(entry_id)
+        return from_snapshot(snapshot) if snapshot is not None else None
+
+    async def async_remove(self, entry_id: str) -> None:
+        if (await self._async_load_all()).pop(entry_id, None) is not None:
+            self._store.async_delay_save(lambda: self._snapshots, SAVE_DELAY)
+
+    def async_save(self, entry_id: str, data: dict[str, Any]) -> None:
+        if self._snapshots is None:
+            self._snapshots = {}
+
+        self._snapshots[entry_id] = to_snapshot(data)
+        self._store.async_delay_save(lambda: self._snapshots, SAVE_DELAY)
@@ -0,0 +1,122 @@
+import math
+from typing import Any, Iterable, Iterator, NamedTuple
+
+from .const import QUERY_NETWORKS
+
+EARTH_RADIUS = 6371.0
+CELL_SIZE = 0.25
+
+
+class FMIStation(NamedTuple):
+    fmisid: str
+    name: str
+    geoid: str | None
+    latitude: float
+    longitude: float
+    networks: tuple[str, ...]
+
+    def as_list(self) -> list[Any]:
+        return [self.fmisid, self.name, self.geoid, self.latitude, self.longitude, list(self.networks)]
+
+    @classmethod
+    def from_list(cls, item: list[Any]) -> "FMIStation":
+        return cls(item[0], item[1], item[2], item[3], item[4], tuple(item[5]))
+
+
+def get_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(1.0, a)))
+
+
+def parse_latlon(value: str) -> tuple[float, float] | None:
+    try:
+        lat, lon = (float(part) for part in value.split(","))
+    except ValueError:
+        return None
+    return lat, lon
+
+
+def in_networks(station: FMIStation, networks: set[str] | None) -> bool:
+    return networks is None or not networks.isdisjoint(station.networks)
+
+
+def get_query_networks(query_id: str, networks: Iterable[str]) -> set[str] | None:
+    keywords = next((keywords for fragment, keywords in QUERY_NETWORKS if fragment in query_id), None)
+    if keywords is None:
+        return None
+
+    # None rather than an empty set when the catalogue names its networks differently, so nothing is filtered out
+    found = {network for network in networks if any(keyword in network.lower() for keyword in keywords)}
+    return found or None
+
+
+class FMIStationIndex:
+    """Grid of CELL_SIZE degree cells over the station catalogue for nearest station lookups"""
+
+    def __init__(self, stations: list[FMIStation]):
+        self._stations = {station.fmisid: station for station in stations}
+        self.networks = {network for station in stations for network in station.networks}
+        self._cells: dict[tuple[int, int], list[FMIStation]] = {}
+
+        for station in stations:
+            self._cells.setdefault(self._cell(station.latitude, station.longitude), []).append(station)
+
+        max_lat = max((abs(station.latitude) for station in stations), default=0.0)
+        self._cell_km = math.radians(CELL_SIZE) * EARTH_RADIUS * min(1.0, math.cos(math.radians(min(max_lat, 89.0))))
+        rows = [row for row, _ in self._cells.keys()] or [0]
+        cols = [col for _, col in self._cells.keys()] or [0]
+        self._bounds = (min(rows), max(rows), min(cols), max(cols))
+
+    def __len__(self) -> int:
+        return len(self._stations)
+
+    def get(self, fmisid: str) -> FMIStation | None:
+        return self._stations.get(str(fmisid))
+
+    def search(self, name: str, networks: set[str] | None = None) -> list[FMIStation]:
+        name = name.strip().lower()
+        return sorted((station for station in self._stations.values()
+                       if name in station.name.lower() and in_networks(station, networks)),
+                      key=lambda station: (not station.name.lower().startswith(name), station.name))
+
+    def nearest(self, lat: float, lon: float, count: int = 1, networks: set[str] | None = None,
+                max_distance: float | None = None) -> list[tuple[float, FMIStation]]:
+        row, col = self._cell(lat, lon)
+        found: list[tuple[float, FMIStation]] = []
+
+        for ring in range(self._max_ring(row, col) + 1):
+            for cell in self._ring(row, col, ring):
+                for station in self._cells.get(cell, []):
+                    if in_networks(station, networks):
+                        found.append((get_distance(lat, lon, station.latitude, station.longitude), station))
+
+            found.sort(key=lambda item: item[0])
+            # every station closer than `ring` whole cells has been visited by now
+            if len(found) >= count and found[count - 1][0] <= ring * self._cell_km:
+                break
+            if max_distance is not None and ring * self._cell_km > max_distance:
+                break
+
+        return [item for item in found[:count] if max_distance is None or item[0] <= max_distance]
+
+    def _max_ring(self, row: int, col: int) -> int:
+        min_row, max_row, min_col, max_col = self._bounds
+        return max(abs(row - min_row), abs(row - max_row), abs(col - min_col), abs(col - max_col))
+
+    @staticmethod
+    def _cell(lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / CELL_SIZE), math.floor(lon / CELL_SIZE)
+
+    @staticmethod
+    def _ring(row: int, col: int, ring: int) -> Iterator[tuple[int, int]]:
+        if ring == 0:
+            yield row, col
+            return
+
+        for offset in range(-ring, ring + 1):
+            yield row - ring, col + offset
+            yield row + ring, col + offset
+        for offset in range(-ring + 1, ring):
+            yield row + offset, col - ring
+            yield row + offset, col + ring
@@ -0,0 +1,105 @@
+from datetime import datetime
+from typing import Any
+
+
+class FMIRequestStats:
+    """Counters and timings of the requests made for one stored query, endpoint or config entry"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.members = 0
+        self.connect_time = 0.0
+        self.download_time = 0.0
+        self.parse_time = 0.0
+        self.unit_lookup_time = 0.0
+        self.unit_lookups = 0
+        self.last_request: datetime | None = None
+        self.last_duration: float | None = None
+        self.last_bytes: int | None = None
+        self.last_members: int | None = None
+        self.last_error: str | None = None
+
+    def record_request(self, connect: float, download: float, parse: float, size: int, members: int | None) -> None:
+        self.requests += 1
+        self.bytes += size
+        self.connect_time += connect
+        self.download_time += download
+        self.parse_time += parse
+        self.last_request = datetime.utcnow()
+        self.last_duration = connect + download + parse
+        self.last_bytes = size
+        if members is not None:
+            self.members += members
+            self.last_members = members
+
+    def record_error(self, error: str) -> None:
+        self.errors += 1
+        self.last_error = error
+
+    def add(self, other: "FMIRequestStats") -> None:
+        self.requests += other.requests
+        self.errors += other.errors
+        self.bytes += other.bytes
+        self.members += other.members
+        self.connect_time += other.connect_time
+        self.download_time += other.download_time
+        self.parse_time += other.parse_time
+        if other.last_request is not None:
+            self.last_request = other.last_request
+            self.last_duration = other.last_duration
+            self.last_bytes = other.last_bytes
+            self.last_members = other.last_members
+        if other.last_error is not None:
+            self.last_error = other.last_error
+
+    def record_unit_lookup(self, duration: float) -> None:
+        self.unit_lookups += 1
+        self.unit_lookup_time += duration
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "members": self.members,
+            "connect_time": round(self.connect_time, 4),
+            "download_time": round(self.download_time, 4),
+            "parse_time": round(self.parse_time, 4),
+            "unit_lookups": self.unit_lookups,
+            "unit_lookup_time": round(self.unit_lookup_time, 4),
+            "last_request": self.last_request.isoformat() if self.last_request is not None else None,
+            "last_duration": round(self.last_duration, 4) if self.last_duration is not None else None,
+            "last_bytes": self.last_bytes,
+            "last_members": self.last_members,
+            "last_error": self.last_error,
+        }
+
+
+class FMIStats:
+    """Traffic statistics of an FMISession and the caches built on it"""
+
+    def __init__(self):
+        self.queries: dict[str, FMIRequestStats] = {}
+        self.cache_hits: dict[str, int] = {}
+        self.cache_misses: dict[str, int] = {}
+
+    def query(self, name: str) -> FMIRequestStats:
+        if name not in self.queries:
+            self.queries[name] = FMIRequestStats()
+        return self.queries[name]
+
+    def record_cache(self, cache: str, hit: bool) -> None:
+        counters = self.cache_hits if hit else self.cache_misses
+        counters[cache] = counters.get(cache, 0) + 1
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "requests": sum(stats.requests for stats in self.queries.values()),
+            "errors": sum(stats.errors for stats in self.queries.values()),
+            "bytes": sum(stats.bytes for stats in self.queries.values()),
+            "cache_hits": dict(self.cache_hits),
+            "cache_misses": dict(self.cache_misses),
+            "queries": {name: stats.as_dict() for name, stats in self.queries.items()},
+        }
@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timedelta
+import logging
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .const import STORAGE_VERSION, STORAGE_KEY_UNITS, UNIT_CACHE_MAX_AGE
+from .session import FMISession, FMIException, get_fixed_unit, get_property_type
+
+_LOGGER = logging.getLogger(__name__)
+
+SAVE_DELAY = 10
+
+
+class FMIUnitCache:
+    """Unit catalogue from the /meta endpoint indexed by parameter id, shared by all entries and kept on disk"""
+
+    def __init__(self, hass: HomeAssistant, session: FMISession):
+        self._session = session
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY_UNITS)
+        self._catalogues: dict[str, dict[str, Any]] | None = None
+        self._lock = asyncio.Lock()
+
+    async def async_get_unit_map(self, lang: str, query_id: str, param_names: list[str]) -> dict[str, str | None]:
+        if query_id.startswith("stuk::"):
+            return {name.lower(): get_fixed_unit(query_id) for name in param_names}
+
+        units = await self.async_get_units(lang, get_property_type(query_id))
+        return {name.lower(): units.get(name.lower()) for name in param_names}
+
+    async def async_get_units(self, lang: str, property_type: str) -> dict[str, str]:
+        async with self._lock:
+            if self._catalogues is None:
+                self._catalogues = await self._store.async_load() or {}
+
+            key = f"{lang}:{property_type}"
+            catalogue = self._catalogues.get(key)
+
+            if catalogue is not None and datetime.utcnow() - datetime.fromisoformat(catalogue["updated"]) < timedelta(
+                    days=UNIT_CACHE_MAX_AGE):
+                self._session.stats.record_cache("units", True)
+                return catalogue["units"]
+
+            self._session.stats.record_cache("units", False)
+
+            try:
+                units = await self._session.async_get_units(lang, property_type)
+            except FMIException as exception:
+                if catalogue is None:
+                    raise
+                _LOGGER.warning(f"Could not refresh FMI unit catalogue, using cached units ({exception})")
+                return catalogue["units"]
+
+            self._catalogues[key] = {"updated": datetime.utcnow().isoformat(), "units": units}
+            self._store.async_delay_save(lambda: self._catalogues, SAVE_DELAY)
+
+            return units
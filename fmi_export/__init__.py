@@ -0,0 +1,19 @@
+"""Standalone bulk export of FMI data, built on the integration's session and parsers.
+
+The integration package imports Home Assistant in its ``__init__``. The exporter, the benchmarks and the tests only use
+the parts that do not need it, so ``load_fmi`` registers ``custom_components/fmi`` as a bare package without executing
+that ``__init__``.
+"""
+import os
+import sys
+import types
+
+PACKAGE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "custom_components", "fmi")
+
+
+def load_fmi() -> types.ModuleType:
+    if "fmi" not in sys.modules:
+        package = types.ModuleType("fmi")
+        package.__path__ = [PACKAGE_PATH]
+        sys.modules["fmi"] = package
+    return sys.modules["fmi"]
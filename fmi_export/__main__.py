@@ -0,0 +1,114 @@
+"""Downloads a stored query for many targets over a long period and writes it to a CSV or Parquet file.
+
+    python -m fmi_export --query fmi::observations::weather::multipointcoverage --fmisid 100971 --fmisid 101004 \\
+        --start 2024-01-01 --end 2024-03-01 --parameters t2m,ws_10min --output weather.csv
+
+The period is split into chunks per target, which are downloaded by a bounded number of workers under the shared
+request budget, stream-parsed, and appended to the output as they complete. Rows are in long format: target, latitude,
+longitude, time, parameter and value. Parquet output needs pyarrow.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timezone
+import logging
+import os
+import sys
+
+from . import load_fmi
+
+load_fmi()
+
+from fmi.const import API_BASE_URL, LANGUAGES, TARGET_TYPES, BACKFILL_CHUNK_HOURS, EXPORT_CONCURRENCY, \
+    EXPORT_RETRIES, EXPORT_MAX_OUTAGE, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_REQUEST_BURST  # noqa: E402
+from fmi.export import EXPORT_WRITERS, FMIBulkDownloader, get_export_jobs  # noqa: E402
+from fmi.limiter import FMIRequestLimiter  # noqa: E402
+from fmi.session import FMISession, FMIException, parse_parameters  # noqa: E402
+
+
+def parse_datetime(value: str) -> datetime:
+    time = datetime.fromisoformat(value)
+    return time.astimezone(timezone.utc).replace(tzinfo=None) if time.tzinfo is not None else time
+
+
+def read_targets(args: argparse.Namespace) -> tuple[str, list[str]]:
+    target_types = [target_type for target_type in TARGET_TYPES if getattr(args, target_type)]
+    if len(target_types) > 1:
+        raise SystemExit("Targets of only one type can be exported at a time")
+
+    target_type = target_types[0] if target_types else "fmisid"
+    targets = list(getattr(args, target_type) or [])
+
+    if args.targets_file is not None:
+        with open(args.targets_file, encoding="utf-8") as file:
+            targets += [line.strip() for line in file if line.strip() != "" and not line.startswith("#")]
+
+    if len(targets) == 0:
+        raise SystemExit("No targets given")
+
+    return target_type, targets
+
+
+async def async_export(args: argparse.Namespace, target_type: str, targets: list[str]) -> int:
+    limiter = FMIRequestLimiter(args.requests_per_minute, args.burst)
+    session = FMISession(timeout=args.timeout, base_url=args.base_url, limiter=limiter)
+    writer = EXPORT_WRITERS[args.format](args.output)
+
+    downloader = FMIBulkDownloader(session, writer, args.lang, args.query,
+                                   parse_parameters(args.parameters) if args.parameters else None,
+                                   args.concurrency, args.retries, args.max_outage)
+    jobs = get_export_jobs(target_type, targets, parse_datetime(args.start), parse_datetime(args.end),
+                           args.chunk_hours)
+
+    try:
+        await downloader.async_run(jobs)
+    finally:
+        writer.close()
+        await session.async_close()
+
+    stats = session.stats.as_dict()
+    print(f"{downloader.completed}/{len(jobs)} chunks, {downloader.rows} rows, {stats['requests']} requests, "
+          f"{stats['bytes']} bytes downloaded, written to {args.output}", file=sys.stderr)
+    for job, error in downloader.failed:
+        print(f"failed: {job.target_type}={job.target} {job.start} - {job.end}: {error}", file=sys.stderr)
+
+    return 1 if downloader.failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m fmi_export", description="Bulk export of FMI stored queries")
+    parser.add_argument("--query", required=True, help="stored query id")
+    for target_type in TARGET_TYPES:
+        parser.add_argument(f"--{target_type}", action="append", help=f"{target_type} target, can be repeated")
+    parser.add_argument("--targets-file", help="file with one target per line")
+    parser.add_argument("--start", required=True, help="ISO time, UTC unless an offset is given")
+    parser.add_argument("--end", default=datetime.utcnow().isoformat(timespec="seconds"))
+    parser.add_argument("--parameters", help="comma separated parameters, all parameters of the query by default")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--format", choices=list(EXPORT_WRITERS.keys()))
+    parser.add_argument("--lang", choices=LANGUAGES, default="eng")
+    parser.add_argument("--chunk-hours", type=int, default=BACKFILL_CHUNK_HOURS)
+    parser.add_argument("--concurrency", type=int, default=EXPORT_CONCURRENCY)
+    parser.add_argument("--retries", type=int, default=EXPORT_RETRIES)
+    parser.add_argument("--max-outage", type=float, default=EXPORT_MAX_OUTAGE,
+                        help="seconds a chunk waits for an unavailable FMI before it fails")
+    parser.add_argument("--requests-per-minute", type=float, default=DEFAULT_REQUESTS_PER_MINUTE)
+    parser.add_argument("--burst", type=int, default=DEFAULT_REQUEST_BURST)
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument("--base-url", default=API_BASE_URL)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.format is None:
+        args.format = "parquet" if os.path.splitext(args.output)[1] == ".parquet" else "csv"
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    target_type, targets = read_targets(args)
+
+    try:
+        sys.exit(asyncio.run(async_export(args, target_type, targets)))
+    except FMIException as exception:
+        raise SystemExit(str(exception))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from fmi_export import load_fmi
+
+load_fmi()
+
+from fmi.breaker import FMICircuitBreaker, PERMIT_PROBE, PERMIT_REQUEST, STATE_HALF_OPEN, STATE_OPEN  # noqa: E402
+from fmi.limiter import FMIRequestLimiter  # noqa: E402
+from fmi.session import FMISession, FMIException  # noqa: E402
+
+QUERY_ID = "fmi::observations::weather::simple"
+
+
+def open_breaker(breaker: FMICircuitBreaker) -> None:
+    for _ in range(3):
+        breaker.record_failure()
+
+
+def test_only_one_caller_probes():
+    breaker = FMICircuitBreaker(threshold=3, reset_timeout=0)
+    open_breaker(breaker)
+
+    assert breaker.allow() == PERMIT_PROBE
+    assert breaker.allow() is None
+    assert breaker.state == STATE_HALF_OPEN
+
+    breaker.record_success()
+    assert breaker.allow() == PERMIT_REQUEST
+
+
+def test_request_finishing_during_probe_leaves_probe_alone():
+    breaker = FMICircuitBreaker(threshold=3, reset_timeout=0)
+    open_breaker(breaker)
+    assert breaker.allow() == PERMIT_PROBE
+
+    # a request sent before the breaker opened fails while the probe is still running
+    breaker.record_failure()
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow() is None
+
+    breaker.record_failure(probe=True)
+    assert breaker.state == STATE_OPEN
+    assert breaker.as_dict()["reset_timeout"] == 0
+
+
+def test_released_probe_can_be_retried_right_away():
+    breaker = FMICircuitBreaker(threshold=3, reset_timeout=60)
+    open_breaker(breaker)
+    breaker._opened = time.monotonic() - 60
+
+    assert breaker.allow() == PERMIT_PROBE
+    breaker.release_probe()
+    assert breaker.allow() == PERMIT_PROBE
+
+
+class UnavailableServer:
+    """Answers every request with 503 and counts getFeature requests and probes"""
+
+    def __init__(self):
+        self.requests = 0
+        self.probes = 0
+        self.server = TestServer(self._create_app())
+
+    def _create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/wfs/{lang}", self._handle_feature)
+        app.router.add_get("/wfs", self._handle_probe)
+        return app
+
+    async def _handle_feature(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.Response(status=503)
+
+    async def _handle_probe(self, request: web.Request) -> web.Response:
+        self.probes += 1
+        await asyncio.sleep(0.05)
+        return web.Response(status=503)
+
+    @property
+    def base_url(self) -> str:
+        return str(self.server.make_url("")).rstrip("/")
+
+
+async def async_request_all(session: FMISession, count: int, offset: int = 0) -> list[Exception]:
+    results = await asyncio.gather(*[session.async_get_features("eng", {"storedquery_id": QUERY_ID,
+                                                                        "fmisid": str(100000 + offset + index)}, False)
+                                     for index in range(count)], return_exceptions=True)
+    assert all(isinstance(result, FMIException) for result in results)
+    return results
+
+
+def test_queued_requests_are_not_sent_once_the_breaker_opens():
+    async def async_run() -> int:
+        server = UnavailableServer()
+        await server.server.start_server()
+        session = FMISession(base_url=server.base_url, limiter=FMIRequestLimiter(600, 1))
+        try:
+            await async_request_all(session, 20)
+        finally:
+            await session.async_close()
+            await server.server.close()
+        return server.requests
+
+    assert asyncio.run(async_run()) == 3
+
+
+def test_queued_requests_do_not_probe():
+    async def async_run() -> tuple[int, int]:
+        server = UnavailableServer()
+        await server.server.start_server()
+        session = FMISession(base_url=server.base_url, limiter=FMIRequestLimiter(600, 1))
+        session.breakers[server.server.make_url("").raw_authority] = FMICircuitBreaker(reset_timeout=0.2)
+        try:
+            await async_request_all(session, 3)
+            await asyncio.sleep(0.2)
+            await async_request_all(session, 10, 3)
+        finally:
+            await session.async_close()
+            await server.server.close()
+        return server.requests, server.probes
+
+    assert asyncio.run(async_run()) == (3, 1)
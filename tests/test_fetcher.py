@@ -0,0 +1,162 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fmi_export import load_fmi
+
+load_fmi()
+
+import fmi.fetcher  # noqa: E402
+from fmi.fetcher import FMIFetcher, FMIQueryKey, merge_latest  # noqa: E402
+from fmi.stats import FMIRequestStats, FMIStats  # noqa: E402
+
+QUERY_ID = "fmi::observations::weather::simple"
+POSITIONS = {"100971": ("60.17", "24.94"), "101004": ("60.20", "24.96"), "101007": ("60.33", "24.97")}
+
+
+def get_key(fmisid: str) -> FMIQueryKey:
+    return FMIQueryKey("eng", QUERY_ID, "fmisid", fmisid, None, None, None)
+
+
+def get_features(fmisid: str, time: datetime, value: float) -> dict:
+    lat, lon = POSITIONS[fmisid]
+    return {"latitude": lat, "longitude": lon, "query_id": QUERY_ID,
+            "parameters": {"t2m": [{"time": time, "value": str(value)}]}}
+
+
+class FakeSession:
+    """Answers getFeature requests from a table of features by fmisid and records the parameters of every request"""
+
+    def __init__(self, features: dict[str, dict]):
+        self.features = features
+        self.requests: list[dict] = []
+        self.stats = FMIStats()
+
+    async def async_get_features(self, lang: str, params: dict, get_latest: bool, stats=None) -> dict:
+        self.requests.append(dict(params))
+        stats.record_request(0.0, 0.0, 0.0, 100, 1)
+        return self.features[params["fmisid"]]
+
+    async def async_get_features_by_location(self, lang: str, params: dict, get_latest: bool, stats=None) -> dict:
+        self.requests.append(dict(params))
+        stats.record_request(0.0, 0.0, 0.0, 100 * len(params["fmisid"]), len(params["fmisid"]))
+        return {(features["latitude"], features["longitude"]): features
+                for fmisid, features in self.features.items() if fmisid in params["fmisid"]}
+
+
+def fetch_all(fetcher: FMIFetcher, fmisids: list[str], stats: list[FMIRequestStats] | None = None) -> list[dict]:
+    async def async_fetch() -> list[dict]:
+        return await asyncio.gather(*[fetcher.async_get_features(get_key(fmisid), stats[index] if stats else None)
+                                      for index, fmisid in enumerate(fmisids)])
+
+    fetcher.invalidate()
+    return asyncio.run(asyncio.wait_for(async_fetch(), 5))
+
+
+def parse_request_time(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d%%20%H:%M:%S")
+
+
+def test_batch_is_split_by_learned_position(monkeypatch):
+    monkeypatch.setattr(fmi.fetcher, "BATCH_DELAY", 0.01)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    session = FakeSession({fmisid: get_features(fmisid, now, index) for index, fmisid in enumerate(POSITIONS)})
+    fetcher = FMIFetcher(session)
+
+    # positions are only known after a single-target request for every station
+    for fmisid in POSITIONS:
+        fetch_all(fetcher, [fmisid])
+    assert len(session.requests) == 3
+
+    results = fetch_all(fetcher, list(POSITIONS))
+
+    assert len(session.requests) == 4
+    assert session.requests[-1]["fmisid"] == list(POSITIONS)
+    assert [result["parameters"]["t2m"][0]["value"] for result in results] == ["0", "1", "2"]
+
+
+def test_target_missing_from_batch_keeps_its_previous_values(monkeypatch):
+    monkeypatch.setattr(fmi.fetcher, "BATCH_DELAY", 0.01)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    session = FakeSession({fmisid: get_features(fmisid, now, index) for index, fmisid in enumerate(POSITIONS)})
+    fetcher = FMIFetcher(session)
+    for fmisid in POSITIONS:
+        fetch_all(fetcher, [fmisid])
+
+    del session.features["101004"]
+    results = fetch_all(fetcher, list(POSITIONS))
+
+    assert results[0]["parameters"]["t2m"][0]["value"] == "0"
+    assert results[2]["parameters"]["t2m"][0]["value"] == "2"
+    # the station that did not answer keeps its latest value from the earlier request
+    assert results[1]["parameters"]["t2m"][0]["value"] == "1"
+    assert results[1]["latitude"] == POSITIONS["101004"][0]
+
+
+def test_batched_download_is_charged_to_every_entry(monkeypatch):
+    monkeypatch.setattr(fmi.fetcher, "BATCH_DELAY", 0.01)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    session = FakeSession({fmisid: get_features(fmisid, now, index) for index, fmisid in enumerate(POSITIONS)})
+    fetcher = FMIFetcher(session)
+    for fmisid in POSITIONS:
+        fetch_all(fetcher, [fmisid])
+
+    # two entries share the first station, the batch covers all three stations
+    stats = [FMIRequestStats() for _ in range(4)]
+    fetch_all(fetcher, list(POSITIONS) + ["100971"], stats)
+
+    assert [item.requests for item in stats] == [1, 1, 1, 1]
+    assert [item.bytes for item in stats] == [300, 300, 300, 300]
+
+
+def test_batch_starts_at_the_oldest_newest_sample(monkeypatch):
+    monkeypatch.setattr(fmi.fetcher, "BATCH_DELAY", 0.01)
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    session = FakeSession({"100971": get_features("100971", now - timedelta(minutes=10), 1),
+                           "101004": get_features("101004", now - timedelta(minutes=70), 2)})
+    fetcher = FMIFetcher(session)
+    fetch_all(fetcher, ["100971"])
+    fetch_all(fetcher, ["101004"])
+
+    fetch_all(fetcher, ["100971", "101004"])
+
+    expected = now - timedelta(minutes=70 + fmi.fetcher.INCREMENTAL_OVERLAP)
+    assert parse_request_time(session.requests[-1]["starttime"]) == expected.replace(tzinfo=None)
+
+
+def test_batch_falls_back_to_full_window_for_a_new_target(monkeypatch):
+    monkeypatch.setattr(fmi.fetcher, "BATCH_DELAY", 0.01)
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    session = FakeSession({fmisid: get_features(fmisid, now - timedelta(minutes=10), index)
+                           for index, fmisid in enumerate(POSITIONS)})
+    fetcher = FMIFetcher(session)
+    for fmisid in POSITIONS:
+        fetch_all(fetcher, [fmisid])
+    fetch_all(fetcher, ["100971", "101004"])
+    assert parse_request_time(session.requests[-1]["starttime"]) > datetime.utcnow() - timedelta(hours=1)
+
+    # a target without an earlier sample needs the whole 12 hour window, so the batch asks for it
+    fetcher._latest.pop(get_key("101007"))
+    fetch_all(fetcher, list(POSITIONS))
+
+    assert parse_request_time(session.requests[-1]["starttime"]) < datetime.utcnow() - timedelta(hours=11)
+
+
+def test_merge_keeps_parameters_missing_from_the_new_slice():
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    window_start = (now - timedelta(hours=12)).replace(tzinfo=None)
+    previous = {"latitude": "60.17", "longitude": "24.94", "query_id": QUERY_ID, "parameters": {
+        "t2m": [{"time": now - timedelta(minutes=10), "value": "1.0"}],
+        "ws_10min": [{"time": now - timedelta(minutes=10), "value": "3.0"}],
+        "snow_aws": [{"time": now - timedelta(hours=13), "value": "20"}],
+    }}
+    features = {"latitude": None, "longitude": None, "query_id": QUERY_ID, "parameters": {
+        "t2m": [{"time": now, "value": "2.0"}],
+        "ws_10min": [],
+    }}
+
+    result = merge_latest(previous, features, window_start)
+
+    assert result["latitude"] == "60.17"
+    assert result["parameters"]["t2m"][0]["value"] == "2.0"
+    assert result["parameters"]["ws_10min"][0]["value"] == "3.0"
+    assert "snow_aws" not in result["parameters"]
@@ -0,0 +1,127 @@
+from datetime import datetime, timezone
+
+from fmi_export import load_fmi
+
+load_fmi()
+
+from fmi.parser import get_feature_parser, parse_features  # noqa: E402
+
+SIMPLE_QUERY = "fmi::observations::weather::simple"
+COVERAGE_QUERY = "fmi::observations::weather::multipointcoverage"
+PARAMETERS = ["t2m", "ws_10min"]
+STATIONS = [("60.17", "24.94"), ("60.20", "24.96")]
+EPOCHS = [1704067200, 1704067800, 1704068400]
+
+# value of every parameter per station and time, NaN where the station did not report
+SAMPLES = [
+    (STATIONS[0], EPOCHS[0], ["1.0", "3.0"]),
+    (STATIONS[0], EPOCHS[1], ["1.5", "NaN"]),
+    (STATIONS[0], EPOCHS[2], ["2.0", "NaN"]),
+    (STATIONS[1], EPOCHS[0], ["-4.0", "5.0"]),
+    (STATIONS[1], EPOCHS[1], ["NaN", "6.5"]),
+    (STATIONS[1], EPOCHS[2], ["NaN", "NaN"]),
+]
+
+HEADER = b"""<?xml version="1.0" encoding="UTF-8"?>
+<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" xmlns:gml="http://www.opengis.net/gml/3.2"
+    xmlns:BsWfs="http://xml.fmi.fi/schema/wfs/2.0" xmlns:gmlcov="http://www.opengis.net/gmlcov/1.0"
+    xmlns:swe="http://www.opengis.net/swe/2.0">
+"""
+
+
+def get_time(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def simple_document(samples: list) -> bytes:
+    members = "".join(f"""
+  <wfs:member>
+    <BsWfs:BsWfsElement gml:id="BsWfsElement.{index}.{name}">
+      <BsWfs:Location><gml:Point><gml:pos>{lat} {lon} </gml:pos></gml:Point></BsWfs:Location>
+      <BsWfs:Time>{get_time(epoch)}</BsWfs:Time>
+      <BsWfs:ParameterName>{name}</BsWfs:ParameterName>
+      <BsWfs:ParameterValue>{value}</BsWfs:ParameterValue>
+    </BsWfs:BsWfsElement>
+  </wfs:member>""" for index, ((lat, lon), epoch, values) in enumerate(samples)
+                      for name, value in zip(PARAMETERS, values))
+    return HEADER + members.encode() + b"\n</wfs:FeatureCollection>\n"
+
+
+def coverage_document(samples: list) -> bytes:
+    positions = "\n".join(f"{lat} {lon}  {epoch}" for (lat, lon), epoch, _ in samples)
+    values = "\n".join(" ".join(values) for _, _, values in samples)
+    fields = "".join(f'<swe:field name="{name}" xlink:href="x"/>' for name in PARAMETERS)
+    member = f"""
+  <wfs:member>
+    <gmlcov:MultiPointCoverage gml:id="mpcv1">
+      <gml:domainSet><gmlcov:SimpleMultiPoint gml:id="mp1" srsDimension="3">
+        <gmlcov:positions>{positions}</gmlcov:positions>
+      </gmlcov:SimpleMultiPoint></gml:domainSet>
+      <gml:rangeSet><gml:DataBlock><gml:rangeParameters/>
+        <gml:doubleOrNilReasonTupleList>{values}</gml:doubleOrNilReasonTupleList>
+      </gml:DataBlock></gml:rangeSet>
+      <gmlcov:rangeType><swe:DataRecord>{fields}</swe:DataRecord></gmlcov:rangeType>
+    </gmlcov:MultiPointCoverage>
+  </wfs:member>"""
+    return HEADER.replace(b'swe/2.0">', b'swe/2.0" xmlns:xlink="http://www.w3.org/1999/xlink">') + member.encode() + \
+        b"\n</wfs:FeatureCollection>\n"
+
+
+def parse(content: bytes, query_id: str, get_latest: bool, by_location: bool = False, chunk_size: int = 7):
+    parser = get_feature_parser(query_id, get_latest, by_location)
+    for offset in range(0, len(content), chunk_size):
+        parser.feed(content[offset:offset + chunk_size])
+    return parser.close()
+
+
+def without_query(features: dict) -> dict:
+    return {key: value for key, value in features.items() if key != "query_id"}
+
+
+def test_coverage_matches_simple_for_one_station():
+    samples = SAMPLES[:3]
+    for get_latest in (False, True):
+        simple = parse(simple_document(samples), SIMPLE_QUERY, get_latest)
+        coverage = parse(coverage_document(samples), COVERAGE_QUERY, get_latest)
+        assert without_query(coverage) == without_query(simple)
+
+
+def test_coverage_decodes_positions_and_values():
+    features = parse_features(coverage_document(SAMPLES[:3]), COVERAGE_QUERY, False)
+
+    assert (features["latitude"], features["longitude"]) == STATIONS[0]
+    assert features["parameters"]["t2m"] == [
+        {"time": datetime.fromtimestamp(epoch, timezone.utc), "value": value}
+        for epoch, value in zip(EPOCHS, ["1.0", "1.5", "2.0"])]
+    # NaN samples are left out, the parameter is still present
+    assert [item["value"] for item in features["parameters"]["ws_10min"]] == ["3.0"]
+
+
+def test_coverage_splits_runs_by_location():
+    for get_latest in (False, True):
+        simple = parse(simple_document(SAMPLES), SIMPLE_QUERY, get_latest, True)
+        coverage = parse(coverage_document(SAMPLES), COVERAGE_QUERY, get_latest, True)
+
+        assert list(coverage.keys()) == STATIONS
+        assert {coords: without_query(features) for coords, features in coverage.items()} == \
+            {coords: without_query(features) for coords, features in simple.items()}
+
+
+def test_latest_skips_trailing_nan():
+    locations = parse(coverage_document(SAMPLES), COVERAGE_QUERY, True, True)
+
+    first = locations[STATIONS[0]]["parameters"]
+    second = locations[STATIONS[1]]["parameters"]
+    assert [(item["time"].timestamp(), item["value"]) for item in first["t2m"]] == [(EPOCHS[2], "2.0")]
+    assert [(item["time"].timestamp(), item["value"]) for item in first["ws_10min"]] == [(EPOCHS[0], "3.0")]
+    assert [(item["time"].timestamp(), item["value"]) for item in second["t2m"]] == [(EPOCHS[0], "-4.0")]
+    assert [(item["time"].timestamp(), item["value"]) for item in second["ws_10min"]] == [(EPOCHS[1], "6.5")]
+
+
+def test_latest_keeps_every_station_at_the_newest_time():
+    samples = [SAMPLES[0], SAMPLES[3]]
+    simple = parse(simple_document(samples), SIMPLE_QUERY, True)
+    coverage = parse(coverage_document(samples), COVERAGE_QUERY, True)
+
+    assert without_query(coverage) == without_query(simple)
+    assert [item["value"] for item in coverage["parameters"]["t2m"]] == ["1.0", "-4.0"]
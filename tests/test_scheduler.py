@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+
+from fmi_export import load_fmi
+
+load_fmi()
+
+from fmi.const import MIN_POLL_INTERVAL, POLL_JITTER  # noqa: E402
+from fmi.scheduler import EPOCH, FMIPollScheduler  # noqa: E402
+
+QUERY_ID = "fmi::observations::weather::simple"
+NOW = datetime(2024, 1, 1, 12, 0, 10)
+
+
+def test_unavailable_polls_when_the_breaker_reopens():
+    scheduler = FMIPollScheduler(QUERY_ID, "group")
+
+    interval = scheduler.unavailable_interval(NOW, 600)
+
+    assert timedelta(seconds=600) <= interval < timedelta(seconds=600 + POLL_JITTER)
+    # entries of the same group come back together, at the group offset
+    other = FMIPollScheduler(QUERY_ID, "group")
+    assert other.unavailable_interval(NOW, 600) == interval
+    assert ((NOW + interval - EPOCH).total_seconds() - scheduler._offset) % POLL_JITTER == 0
+
+
+def test_unavailable_does_not_grow_the_backoff():
+    scheduler = FMIPollScheduler(QUERY_ID)
+    for _ in range(5):
+        assert scheduler.unavailable_interval(NOW, 0) >= timedelta(minutes=MIN_POLL_INTERVAL)
+
+    assert scheduler.failure_interval() < timedelta(minutes=2)